@@ -1,10 +1,33 @@
+import asyncio
+import gzip
 import hashlib
+import heapq
+import hmac
+import json
+import logging
+import multiprocessing
 import os
+import random
+import re
 import secrets
+import socket
 import sqlite3
+import struct
+import sys
+import threading
 import time
-from collections import defaultdict
+import zlib
+from bisect import bisect_left
+from collections import Counter as StackCounter, OrderedDict, defaultdict
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import closing, nullcontext
+from contextvars import ContextVar
 from datetime import datetime, timedelta
+from functools import partial
+from itertools import islice
+from urllib.parse import urlencode
 
 import httpx
 from fastapi import FastAPI, Request
@@ -12,16 +35,102 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse, PlainTextResponse, RedirectResponse, Response
 from pydantic import BaseModel
 
+try:
+    from pypinyin import lazy_pinyin
+except ImportError:  # 未安装时搜索建议不支持拼音匹配
+    lazy_pinyin = None
+
+try:
+    import brotli
+except ImportError:  # 未安装时不提供 br 压缩
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # 未安装时不提供 zstd 压缩
+    zstandard = None
+
+logger = logging.getLogger("tunehub")
+
 BASE_URL = os.getenv("TUNEHUB_BASE_URL", "https://music-dl.sayqz.com")
 DB_PATH = os.getenv(
     "TUNEHUB_DB_PATH", os.path.join(os.path.dirname(__file__), "tunehub.sqlite")
 )
 
+# 上游响应缓存：内存LRU + 磁盘SQLite，磁盘文件跨重启保留、同机多worker共享
+UPSTREAM_CACHE_PATH = os.getenv(
+    "TUNEHUB_CACHE_PATH", os.path.join(os.path.dirname(DB_PATH), "tunehub_cache.sqlite")
+)
+UPSTREAM_CACHE_MAX_BYTES = int(os.getenv("UPSTREAM_CACHE_MAX_MB", "256")) * 1024 * 1024
+UPSTREAM_CACHE_MEMORY_ENTRIES = int(os.getenv("UPSTREAM_CACHE_MEMORY_ENTRIES", "512"))
+UPSTREAM_CACHE_EVICT_EVERY = 64  # 每写入多少条检查一次磁盘容量
+UPSTREAM_CACHE_WAIT_TIMEOUT = 30  # 合并等待同一上游请求的最长时间（秒）
+# 各请求类型的缓存时间（秒），未列出的类型（如 url）不缓存
+UPSTREAM_CACHE_TTLS = {
+    "toplists": 3600,
+    "toplist": 600,
+    "playlist": 600,
+    "search": 300,
+    "aggregateSearch": 300,
+    "info": 86400,
+    "lrc": 86400,
+    "pic": 86400,
+}
+
+# 响应压缩：按 Accept-Encoding 协商，小于阈值的响应不压缩
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSIBLE_TYPES = ("application/json", "text/")
+# 实时压缩用较低级别；缓存的压缩副本只压缩一次，用较高级别
+COMPRESSION_LEVELS = {
+    "dynamic": {"zstd": 3, "br": 4, "gzip": 6},
+    "cached": {"zstd": 12, "br": 9, "gzip": 9},
+}
+
+# 访问日志归档：早于保留天数的完整日期从 access_logs 移到按天的列式压缩文件
+ACCESS_LOG_ARCHIVE_DIR = os.getenv(
+    "TUNEHUB_LOG_ARCHIVE_DIR", os.path.join(os.path.dirname(DB_PATH), "access_log_archive")
+)
+ACCESS_LOG_HOT_DAYS = int(os.getenv("ACCESS_LOG_HOT_DAYS", "1"))  # 今天之外在数据库中保留的天数
+ACCESS_LOG_ROTATE_INTERVAL = 3600  # 归档检查间隔（秒）
+ACCESS_LOG_ROTATE_BATCH = 1000  # 归档时每批读取和删除的行数，避免长时间占用数据库写锁
+
+# 榜单预热：后台定时刷新各平台榜单、热门榜单歌曲及封面跳转
+PREWARM_ENABLED = os.getenv("PREWARM_ENABLED", "1") == "1"
+PREWARM_INTERVAL = int(os.getenv("PREWARM_INTERVAL", "480"))  # 刷新间隔（秒）
+PREWARM_JITTER = 0.2  # 间隔随机浮动比例，避免多实例同时刷新
+PREWARM_SOURCES = ("netease", "kuwo", "qq")
+PREWARM_TOP_CHARTS = int(os.getenv("PREWARM_TOP_CHARTS", "5"))  # 每个平台预取的榜单数
+PREWARM_TOP_COVERS = int(os.getenv("PREWARM_TOP_COVERS", "10"))  # 每个榜单预取封面的歌曲数
+PREWARM_CONCURRENCY = int(os.getenv("PREWARM_CONCURRENCY", "4"))  # 单次刷新的上游并发数
+
+# 搜索建议：本地FTS5索引，收录搜索结果、榜单、歌单和收藏中出现过的歌曲
+SEARCH_INDEX_PATH = os.getenv(
+    "TUNEHUB_SEARCH_INDEX_PATH", os.path.join(os.path.dirname(DB_PATH), "tunehub_search.sqlite")
+)
+SUGGEST_LIMIT = 10  # 默认返回条数
+SUGGEST_MAX_LIMIT = 50
+
+# 用户首屏数据：/me/bootstrap 返回的收藏条数
+BOOTSTRAP_FAVORITES_LIMIT = 200
+
 # 反爬配置
-RATE_LIMIT_REQUESTS = 60  # 每分钟请求数
-RATE_LIMIT_WINDOW = 60  # 时间窗口（秒）
-MAX_LOGIN_ATTEMPTS = 5  # 最大登录尝试次数
-LOCKOUT_TIME = 300  # 锁定时间（秒）
+RATE_LIMIT_REQUESTS = int(os.getenv("RATE_LIMIT_REQUESTS", "60"))  # 每分钟请求数
+RATE_LIMIT_WINDOW = int(os.getenv("RATE_LIMIT_WINDOW", "60"))  # 时间窗口（秒）
+MAX_LOGIN_ATTEMPTS = int(os.getenv("MAX_LOGIN_ATTEMPTS", "5"))  # 最大登录尝试次数
+LOCKOUT_TIME = int(os.getenv("LOCKOUT_TIME", "300"))  # 锁定时间（秒）
+
+# 密码哈希配置（scrypt，在进程池中计算）
+PASSWORD_HASH_TARGET_MS = float(os.getenv("PASSWORD_HASH_TARGET_MS", "50"))  # 单次哈希目标耗时
+# scrypt 代价参数；未设置时首次启动按目标耗时校准一次并存入数据库，所有worker共用
+PASSWORD_HASH_N = int(os.getenv("PASSWORD_HASH_N", "0"))
+PASSWORD_HASH_WORKERS = int(
+    os.getenv("PASSWORD_HASH_WORKERS", str(max(1, min(4, (os.cpu_count() or 2) // 2))))
+)  # 哈希进程数
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))  # 排队上限，超出直接拒绝
+SCRYPT_MIN_N = 2**14
+SCRYPT_MAX_N = 2**17  # 约128MB内存
+SCRYPT_R = 8
+SCRYPT_P = 1
 
 # 频率限制存储
 rate_limit_store: dict[str, list[float]] = defaultdict(list)
@@ -45,6 +154,355 @@ SUSPICIOUS_UA_PATTERNS = [
     "puppeteer",
     "postman",
 ]
+# User-Agent白名单（命中后覆盖黑名单）
+ALLOWED_UA_PATTERNS: list[str] = []
+# 按路径前缀的User-Agent规则：{prefix: {"allow": [...], "deny": [...]}}
+UA_PATH_RULES: dict[str, dict[str, list[str]]] = {}
+# User-Agent规则文件（JSON，可选，支持热加载）
+UA_RULES_PATH = os.getenv("TUNEHUB_UA_RULES_PATH", "")
+UA_VERDICT_CACHE_SIZE = 4096  # User-Agent判定结果缓存条数
+
+# 中间件路由策略：按路径前缀（最长匹配）声明需要执行的检查和访问日志采样率
+# checks 可选：blacklist / user_agent / rate_limit / login_lockout
+# log_sample 为正常请求写入访问日志的比例，被拦截的请求始终记录
+ROUTE_POLICIES = [
+    # CORS预检请求（带 Access-Control-Request-Method 的 OPTIONS）不做任何检查，也不记录；
+    # 其他 OPTIONS 请求按路径前缀匹配的策略处理
+    {"prefix": "/", "methods": ["OPTIONS"], "checks": [], "log_sample": 0.0},
+    # 容器健康检查
+    {"prefix": "/health", "checks": [], "log_sample": 0.0},
+    {"prefix": "/docs", "checks": ["blacklist"], "log_sample": 0.0},
+    {"prefix": "/redoc", "checks": ["blacklist"], "log_sample": 0.0},
+    {"prefix": "/openapi.json", "checks": ["blacklist"], "log_sample": 0.0},
+    {"prefix": "/status", "checks": ["blacklist", "user_agent"], "log_sample": 0.1},
+    {"prefix": "/metrics", "checks": ["blacklist"], "log_sample": 0.0},
+    # 输入联想请求频繁且只查本地索引，不计入频率限制，日志抽样
+    {"prefix": "/suggest", "checks": ["blacklist", "user_agent"], "log_sample": 0.1},
+    {"prefix": "/api/", "checks": ["blacklist", "user_agent", "rate_limit"], "log_sample": 1.0},
+    {"prefix": "/auth/login", "checks": ["blacklist", "user_agent", "login_lockout"], "log_sample": 1.0},
+    # 注册和修改密码同样要计算一次 scrypt，按IP限流，避免匿名请求占满哈希队列
+    {"prefix": "/auth/register", "checks": ["blacklist", "user_agent", "rate_limit"], "log_sample": 1.0},
+    {"prefix": "/auth/password", "checks": ["blacklist", "user_agent", "rate_limit"], "log_sample": 1.0},
+    {"prefix": "/", "checks": ["blacklist", "user_agent"], "log_sample": 1.0},
+]
+
+# 请求追踪：带追踪请求头或按采样率命中的请求会记录各阶段耗时
+TRACE_HEADER = "x-trace"
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+# X-Trace 头的值必须与该密钥一致才生效；未设置时只按采样率追踪
+TRACE_SECRET = os.getenv("TRACE_SECRET", "")
+SLOW_TRACE_LIMIT = int(os.getenv("SLOW_TRACE_LIMIT", "50"))  # 保留最慢的请求数
+PROFILE_MAX_SECONDS = 30  # 采样分析单次最长时间
+PROFILE_INTERVAL = 0.005  # 采样间隔（秒）
+
+# ==================== 运行指标 ====================
+
+# 延迟直方图的固定分桶（秒）
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# 已注册的指标，按注册顺序输出
+metrics_registry: list = []
+
+
+def format_metric_labels(labelnames: tuple[str, ...], labels: tuple, extra: str = "") -> str:
+    parts = [
+        '{}="{}"'.format(
+            name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        )
+        for name, value in zip(labelnames, labels)
+    ]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    """进程内计数器
+
+    只在事件循环线程内更新，无需加锁；多worker部署时每个进程各自统计，
+    由Prometheus按实例聚合。
+    """
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self._values: dict[tuple, float] = defaultdict(float)
+        metrics_registry.append(self)
+
+    def inc(self, *labels, value: float = 1.0) -> None:
+        self._values[labels] += value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for labels, value in list(self._values.items()):
+            lines.append(f"{self.name}{format_metric_labels(self.labelnames, labels)} {value:g}")
+        return lines
+
+
+class Histogram:
+    """进程内固定分桶直方图，更新方式同 Counter"""
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # {labels: [各分桶计数..., +Inf计数, 总和]}
+        self._series: dict[tuple, list[float]] = {}
+        metrics_registry.append(self)
+
+    def observe(self, value: float, *labels) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 2)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, series in list(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                bucket_labels = format_metric_labels(self.labelnames, labels, f'le="{bound:g}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            cumulative += series[-2]
+            inf_labels = format_metric_labels(self.labelnames, labels, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{inf_labels} {cumulative}")
+            label_str = format_metric_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_str} {series[-1]:g}")
+            lines.append(f"{self.name}_count{label_str} {cumulative}")
+        return lines
+
+
+HTTP_REQUESTS = Counter(
+    "tunehub_http_requests_total", "HTTP请求数", ("method", "route", "status")
+)
+HTTP_LATENCY = Histogram(
+    "tunehub_http_request_duration_seconds", "HTTP请求处理耗时", ("method", "route")
+)
+# 上游指标的 type/source 标签取自客户端参数，未知取值统一记为 other，避免标签无限增长
+UPSTREAM_METRIC_TYPES = {*UPSTREAM_CACHE_TTLS, "url", "pic", ""}
+UPSTREAM_METRIC_SOURCES = {"netease", "kuwo", "qq", ""}
+UPSTREAM_LATENCY = Histogram(
+    "tunehub_upstream_request_duration_seconds", "上游API请求耗时", ("path", "type", "source")
+)
+UPSTREAM_ERRORS = Counter(
+    "tunehub_upstream_errors_total", "上游API请求失败数", ("path", "type", "source")
+)
+CACHE_REQUESTS = Counter(
+    "tunehub_cache_requests_total", "缓存查询次数", ("cache", "result")
+)
+SQLITE_LATENCY = Histogram(
+    "tunehub_sqlite_query_duration_seconds", "SQLite语句执行耗时", ("operation",)
+)
+ANTISPIDER_BLOCKS = Counter(
+    "tunehub_antispider_blocked_total", "反爬拦截次数", ("reason",)
+)
+PASSWORD_HASH_LATENCY = Histogram(
+    "tunehub_password_hash_duration_seconds", "密码哈希耗时（含排队）", ("scheme",)
+)  # scheme 目前只有 scrypt，旧版SHA-256不进进程池
+PASSWORD_HASH_SHED = Counter(
+    "tunehub_password_hash_shed_total", "因排队过长被拒绝的密码哈希请求数"
+)
+COMPRESSION_BYTES = Counter(
+    "tunehub_compression_bytes_total", "响应压缩前后的字节数", ("encoding", "stage")
+)
+PREWARM_REQUESTS = Counter(
+    "tunehub_prewarm_requests_total", "榜单预热的上游请求数", ("type", "result")
+)
+
+
+def render_metrics() -> str:
+    lines: list[str] = []
+    for metric in metrics_registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ==================== 请求追踪 ====================
+
+class RequestTrace:
+    """单个请求的分阶段耗时记录"""
+
+    __slots__ = ("spans", "expose")
+
+    def __init__(self, expose: bool = False):
+        # {阶段名: [累计耗时, 次数]}
+        self.spans: dict[str, list[float]] = {}
+        # 只有显式请求追踪的调用方才能在响应头中看到各阶段耗时
+        self.expose = expose
+
+    def add(self, name: str, duration: float) -> None:
+        span = self.spans.get(name)
+        if span is None:
+            self.spans[name] = [duration, 1]
+        else:
+            span[0] += duration
+            span[1] += 1
+
+    def server_timing(self, total: float) -> str:
+        parts = [
+            f"{name};dur={duration * 1000:.2f}" + (f';desc="x{int(count)}"' if count > 1 else "")
+            for name, (duration, count) in self.spans.items()
+        ]
+        parts.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(parts)
+
+
+class TraceSpan:
+    """计时上下文，退出时把耗时记入当前请求的追踪"""
+
+    __slots__ = ("trace", "name", "start")
+
+    def __init__(self, trace: RequestTrace, name: str):
+        self.trace = trace
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.trace.add(self.name, time.perf_counter() - self.start)
+        return False
+
+
+current_trace: ContextVar[RequestTrace | None] = ContextVar("current_trace", default=None)
+NULL_SPAN = nullcontext()
+
+# 最慢请求的小顶堆：(耗时, 序号, 记录)
+slow_traces: list[tuple[float, int, dict]] = []
+slow_trace_seq = 0
+
+
+def trace_span(name: str):
+    """当前请求开启追踪时计时，否则为空操作"""
+    trace = current_trace.get()
+    if trace is None:
+        return NULL_SPAN
+    return TraceSpan(trace, name)
+
+
+def record_span(name: str, duration: float) -> None:
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add(name, duration)
+
+
+def start_trace(request: Request) -> RequestTrace | None:
+    """带正确密钥的 X-Trace 请求返回 Server-Timing；采样命中的请求只参与最慢请求排名"""
+    token = request.headers.get(TRACE_HEADER)
+    if token and TRACE_SECRET and hmac.compare_digest(token.encode(), TRACE_SECRET.encode()):
+        return RequestTrace(expose=True)
+    if TRACE_SAMPLE_RATE > 0 and random.random() < TRACE_SAMPLE_RATE:
+        return RequestTrace()
+    return None
+
+
+def keep_slow_trace(trace: RequestTrace, request: Request, status_code: int, total: float) -> None:
+    global slow_trace_seq
+    if len(slow_traces) >= SLOW_TRACE_LIMIT and total <= slow_traces[0][0]:
+        return
+    slow_trace_seq += 1
+    record = {
+        "method": request.method,
+        "path": request.url.path,
+        "query": request.url.query,
+        "status_code": status_code,
+        "duration_ms": round(total * 1000, 3),
+        "created_at": datetime.utcnow().isoformat(),
+        "spans": {
+            name: {"duration_ms": round(duration * 1000, 3), "count": int(count)}
+            for name, (duration, count) in trace.spans.items()
+        },
+    }
+    if len(slow_traces) >= SLOW_TRACE_LIMIT:
+        heapq.heapreplace(slow_traces, (total, slow_trace_seq, record))
+    else:
+        heapq.heappush(slow_traces, (total, slow_trace_seq, record))
+
+
+def sample_stacks(thread_id: int, seconds: float, interval: float) -> StackCounter:
+    """在后台线程中周期采样目标线程的调用栈，按折叠格式计数"""
+    stacks: StackCounter = StackCounter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        frame = sys._current_frames().get(thread_id)
+        if frame is not None:
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            stacks[";".join(reversed(names))] += 1
+        time.sleep(interval)
+    return stacks
+
+
+# ==================== 响应压缩 ====================
+
+
+def compress_gzip(body: bytes, level: int) -> bytes:
+    # 固定 mtime，同一内容的压缩结果保持一致
+    return gzip.compress(body, compresslevel=level, mtime=0)
+
+
+def compress_br(body: bytes, level: int) -> bytes:
+    return brotli.compress(body, quality=level)
+
+
+def compress_zstd(body: bytes, level: int) -> bytes:
+    return zstandard.ZstdCompressor(level=level).compress(body)
+
+
+# 同等权重时按此顺序优先选择
+COMPRESSORS = {"gzip": compress_gzip}
+if zstandard is not None:
+    COMPRESSORS = {"zstd": compress_zstd, **COMPRESSORS}
+if brotli is not None:
+    COMPRESSORS = {"br": compress_br, **COMPRESSORS}
+
+
+def choose_encoding(accept_encoding: str) -> str | None:
+    """按 Accept-Encoding 的 q 值选出服务端支持的压缩算法"""
+    weights = {}
+    for item in accept_encoding.lower().split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name.strip()] = q
+    best, best_q = None, 0.0
+    for name in COMPRESSORS:
+        q = weights.get(name, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+def is_compressible(media_type: str, size: int) -> bool:
+    return size >= COMPRESSION_MIN_SIZE and media_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def compress_body(body: bytes, encoding: str, mode: str = "dynamic") -> bytes:
+    compressed = COMPRESSORS[encoding](body, COMPRESSION_LEVELS[mode][encoding])
+    COMPRESSION_BYTES.inc(encoding, "raw", value=len(body))
+    COMPRESSION_BYTES.inc(encoding, "compressed", value=len(compressed))
+    return compressed
+
 
 app = FastAPI(title="TuneHub API", version="1.0.0")
 app.add_middleware(
@@ -55,91 +513,175 @@ app.add_middleware(
 )
 
 
+@app.middleware("http")
+async def compression_middleware(request: Request, call_next):
+    """对未压缩的 JSON 和文本响应按协商结果压缩"""
+    response = await call_next(request)
+    media_type = response.headers.get("content-type", "")
+    if (
+        "content-encoding" in response.headers
+        or not media_type.startswith(COMPRESSIBLE_TYPES)
+        or response.status_code in (204, 304)
+    ):
+        return response
+    response.headers.append("Vary", "Accept-Encoding")
+    encoding = choose_encoding(request.headers.get("accept-encoding", ""))
+    if encoding is None:
+        return response
+    length = response.headers.get("content-length")
+    if length is not None and int(length) < COMPRESSION_MIN_SIZE:
+        return response
+
+    body = b"".join([chunk async for chunk in response.body_iterator])
+    if len(body) >= COMPRESSION_MIN_SIZE:
+        body = compress_body(body, encoding)
+        response.headers["content-encoding"] = encoding
+        # 强校验值对应未压缩内容，压缩后改为弱校验值
+        etag = response.headers.get("etag")
+        if etag and not etag.startswith("W/"):
+            response.headers["etag"] = f"W/{etag}"
+    response.headers["content-length"] = str(len(body))
+
+    async def send_body():
+        yield body
+
+    response.body_iterator = send_body()
+    return response
+
+
 @app.middleware("http")
 async def anti_spider_middleware(request: Request, call_next):
     """反爬虫中间件"""
-    start_time = time.time()
-    ip = request.client.host if request.client else "unknown"
+    start_time = time.perf_counter()
     path = request.url.path
     method = request.method
+    policy = route_policies.lookup(
+        method, path, "access-control-request-method" in request.headers
+    )
+    trace = start_trace(request)
+    if trace is not None:
+        current_trace.set(trace)
+
+    # 无需检查且不记录日志的路由直接放行
+    if not policy.checks and not policy.log_sample:
+        with trace_span("app"):
+            response = await call_next(request)
+        return finish_request(request, response, start_time, trace)
+
+    ip = request.client.host if request.client else "unknown"
     user_agent = request.headers.get("user-agent", "unknown")
     
     # 记录请求
-    blocked = False
+    blocked = ""
     block_reason = ""
     
     # 检查IP黑名单
-    with get_conn() as conn:
-        blacklisted = conn.execute(
-            "SELECT expires_at FROM ip_blacklist WHERE ip = ?",
-            (ip,)
-        ).fetchone()
-        
-        if blacklisted:
-            expires_at = blacklisted["expires_at"]
-            if expires_at and datetime.fromisoformat(expires_at) > datetime.utcnow():
-                blocked = True
+    if policy.blacklist:
+        with trace_span("blacklist"):
+            if is_ip_blacklisted(ip):
+                blocked = "blacklist"
                 block_reason = "IP已被封禁"
-            else:
-                # 过期了，删除记录
-                conn.execute("DELETE FROM ip_blacklist WHERE ip = ?", (ip,))
-                conn.commit()
     
     # 检查User-Agent
-    if not blocked:
-        ua_valid, ua_reason = check_user_agent(user_agent)
+    if not blocked and policy.user_agent:
+        with trace_span("ua"):
+            ua_valid, ua_reason = check_user_agent(user_agent, path)
         if not ua_valid:
-            blocked = True
+            blocked = "user_agent"
             block_reason = ua_reason
     
     # 检查频率限制
-    if not blocked and path.startswith("/api/"):
-        rate_limit_ok, rate_limit_reason = check_rate_limit(ip)
+    if not blocked and policy.rate_limit:
+        with trace_span("ratelimit"):
+            rate_limit_ok, rate_limit_reason = check_rate_limit(ip)
         if not rate_limit_ok:
-            blocked = True
+            blocked = "rate_limit"
             block_reason = rate_limit_reason
     
     # 检查登录锁定
-    if not blocked and path.startswith("/auth/login"):
+    if not blocked and policy.login_lockout:
         lockout_ok, lockout_reason = check_ip_lockout(ip)
         if not lockout_ok:
-            blocked = True
+            blocked = "login_lockout"
             block_reason = lockout_reason
     
     # 如果被阻止，返回错误
     if blocked:
+        ANTISPIDER_BLOCKS.inc(blocked)
         # 记录到访问日志
-        with get_conn() as conn:
-            conn.execute(
-                """
-                INSERT INTO access_logs (ip, path, method, user_agent, status_code, created_at, blocked)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-                """,
-                (ip, path, method, user_agent[:500], 403, datetime.utcnow().isoformat(), 1)
-            )
-            conn.commit()
-        
-        return JSONResponse(
+        with trace_span("accesslog"):
+            log_access(ip, path, method, user_agent, 403, blocked=True)
+        response = JSONResponse(
             {"code": 403, "message": block_reason or "访问被拒绝"},
             status_code=403
         )
+        return finish_request(request, response, start_time, trace)
     
     # 处理请求
-    response = await call_next(request)
+    with trace_span("app"):
+        response = await call_next(request)
+    
+    # 按采样率记录访问日志
+    if policy.should_log():
+        with trace_span("accesslog"):
+            log_access(ip, path, method, user_agent, response.status_code)
     
-    # 记录访问日志（异步处理）
-    process_time = time.time() - start_time
+    return finish_request(request, response, start_time, trace)
+
+
+def finish_request(
+    request: Request, response: Response, start_time: float, trace: RequestTrace | None
+) -> Response:
+    """记录指标，追踪请求附加 Server-Timing 并参与最慢请求排名"""
+    total = time.perf_counter() - start_time
+    observe_request(request, response.status_code, total)
+    if trace is not None:
+        if trace.expose:
+            response.headers["server-timing"] = trace.server_timing(total)
+        keep_slow_trace(trace, request, response.status_code, total)
+    return response
+
+
+def observe_request(request: Request, status_code: int, duration: float) -> None:
+    """记录请求指标，按路由模板而非原始路径聚合，避免标签爆炸"""
+    route = request.scope.get("route")
+    route_path = route.path if route is not None else "unmatched"
+    HTTP_REQUESTS.inc(request.method, route_path, status_code)
+    HTTP_LATENCY.observe(duration, request.method, route_path)
+
+
+def is_ip_blacklisted(ip: str) -> bool:
+    """检查IP是否在黑名单中，顺带清理过期记录"""
+    with get_conn() as conn:
+        blacklisted = conn.execute(
+            "SELECT expires_at FROM ip_blacklist WHERE ip = ?",
+            (ip,)
+        ).fetchone()
+        
+        if not blacklisted:
+            return False
+        expires_at = blacklisted["expires_at"]
+        if expires_at and datetime.fromisoformat(expires_at) > datetime.utcnow():
+            return True
+        # 过期了，删除记录
+        conn.execute("DELETE FROM ip_blacklist WHERE ip = ?", (ip,))
+        conn.commit()
+    return False
+
+
+def log_access(
+    ip: str, path: str, method: str, user_agent: str, status_code: int, blocked: bool = False
+) -> None:
+    """写入访问日志"""
     with get_conn() as conn:
         conn.execute(
             """
             INSERT INTO access_logs (ip, path, method, user_agent, status_code, created_at, blocked)
             VALUES (?, ?, ?, ?, ?, ?, ?)
             """,
-            (ip, path, method, user_agent[:500], response.status_code, datetime.utcnow().isoformat(), 0)
+            (ip, path, method, user_agent[:500], status_code, datetime.utcnow().isoformat(), int(blocked))
         )
         conn.commit()
-    
-    return response
 
 
 class AuthPayload(BaseModel):
@@ -169,8 +711,31 @@ class DeleteAccountPayload(BaseModel):
     password: str
 
 
+class TimedConnection(sqlite3.Connection):
+    """记录语句执行耗时的SQLite连接"""
+
+    def execute(self, sql: str, parameters=(), /):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            duration = time.perf_counter() - start
+            operation = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else "UNKNOWN"
+            SQLITE_LATENCY.observe(duration, operation)
+            record_span("sqlite", duration)
+
+    def commit(self):
+        start = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            duration = time.perf_counter() - start
+            SQLITE_LATENCY.observe(duration, "COMMIT")
+            record_span("sqlite", duration)
+
+
 def get_conn() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False, factory=TimedConnection)
     conn.row_factory = sqlite3.Row
     return conn
 
@@ -238,10 +803,166 @@ def init_db() -> None:
         conn.commit()
 
 
-def hash_password(password: str, salt: str) -> str:
+def legacy_hash_password(password: str, salt: str) -> str:
+    """旧版加盐SHA-256，仅用于校验升级前注册的账号"""
     return hashlib.sha256(f"{salt}{password}".encode("utf-8")).hexdigest()
 
 
+def scrypt_job(password: str, salt: str, n: int, r: int = SCRYPT_R, p: int = SCRYPT_P) -> partial:
+    """构造scrypt计算任务，只引用hashlib，子进程无需导入本模块"""
+    return partial(
+        hashlib.scrypt,
+        password.encode("utf-8"),
+        salt=salt.encode("utf-8"),
+        n=n,
+        r=r,
+        p=p,
+        maxmem=128 * r * (n + p) + 2**20,
+        dklen=32,
+    )
+
+
+def format_scrypt_hash(digest: bytes, n: int, r: int, p: int) -> str:
+    """哈希结果带上参数，参数调整后仍能校验旧哈希"""
+    return f"scrypt${n}${r}${p}${digest.hex()}"
+
+
+def scrypt_hash(password: str, salt: str, n: int, r: int = SCRYPT_R, p: int = SCRYPT_P) -> str:
+    """在当前线程计算scrypt哈希"""
+    return format_scrypt_hash(scrypt_job(password, salt, n, r, p)(), n, r, p)
+
+
+def calibrate_scrypt_n(target_ms: float) -> int:
+    """选取耗时最接近目标的scrypt代价参数"""
+    n = SCRYPT_MIN_N
+    while n < SCRYPT_MAX_N:
+        start = time.perf_counter()
+        scrypt_hash("calibration", "calibration-salt", n)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if elapsed_ms * 1.5 >= target_ms:
+            break
+        n *= 2
+    return n
+
+
+def load_scrypt_n() -> int:
+    """读取全局统一的scrypt代价参数，避免各worker校准结果不同导致反复升级哈希"""
+    if PASSWORD_HASH_N:
+        return PASSWORD_HASH_N
+    with get_conn() as conn:
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS app_settings (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            )
+            """
+        )
+        row = conn.execute("SELECT value FROM app_settings WHERE key = 'scrypt_n'").fetchone()
+        if row is None:
+            # 多个worker同时校准时以先写入的为准
+            conn.execute(
+                "INSERT OR IGNORE INTO app_settings (key, value) VALUES ('scrypt_n', ?)",
+                (str(calibrate_scrypt_n(PASSWORD_HASH_TARGET_MS)),),
+            )
+            conn.commit()
+            row = conn.execute("SELECT value FROM app_settings WHERE key = 'scrypt_n'").fetchone()
+    return int(row["value"])
+
+
+class PasswordHasherBusy(Exception):
+    """密码哈希排队已满"""
+
+
+class PasswordHasher:
+    """在进程池中计算密码哈希，避免阻塞事件循环"""
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.n = SCRYPT_MIN_N
+        self.pending = 0
+        self._executor: ProcessPoolExecutor | None = None
+
+    def start(self) -> None:
+        self.n = load_scrypt_n()
+        self._get_executor()
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn 启动，避免 fork 带有事件循环和线程的服务进程
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    async def _run(self, job: partial) -> bytes:
+        if self.pending >= self.max_pending:
+            PASSWORD_HASH_SHED.inc()
+            raise PasswordHasherBusy()
+        self.pending += 1
+        start = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), job)
+        except BrokenProcessPool:
+            # 子进程异常退出（例如被OOM杀掉）后进程池不可再用，丢弃后下次重建
+            self.shutdown()
+            raise PasswordHasherBusy()
+        finally:
+            self.pending -= 1
+            duration = time.perf_counter() - start
+            PASSWORD_HASH_LATENCY.observe(duration, "scrypt")
+            record_span("kdf", duration)
+
+    async def hash(self, password: str) -> tuple[str, str]:
+        """生成新的盐和哈希，返回 (password_hash, salt)"""
+        salt = secrets.token_hex(16)
+        digest = await self._run(scrypt_job(password, salt, self.n))
+        return format_scrypt_hash(digest, self.n, SCRYPT_R, SCRYPT_P), salt
+
+    async def verify(self, password: str, password_hash: str, salt: str) -> bool:
+        if password_hash.startswith("scrypt$"):
+            try:
+                _, n, r, p, _ = password_hash.split("$")
+                n, r, p = int(n), int(r), int(p)
+            except ValueError:
+                return False
+            digest = await self._run(scrypt_job(password, salt, n, r, p))
+            expected = format_scrypt_hash(digest, n, r, p)
+        else:
+            # 旧版哈希计算很快，直接在事件循环中完成
+            expected = legacy_hash_password(password, salt)
+        return hmac.compare_digest(expected, password_hash)
+
+    async def verify_missing(self, password: str) -> bool:
+        """账号不存在时也做一次同等代价的计算，避免通过耗时判断账号是否存在"""
+        await self._run(scrypt_job(password, "missing-user-salt", self.n))
+        return False
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        """旧版哈希或代价低于当前参数的scrypt哈希需要升级"""
+        if not password_hash.startswith("scrypt$"):
+            return True
+        try:
+            _, n, r, p, _ = password_hash.split("$")
+            return int(n) < self.n or int(r) != SCRYPT_R or int(p) != SCRYPT_P
+        except ValueError:
+            return True
+
+
+password_hasher = PasswordHasher(PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING)
+
+
+def busy_response() -> JSONResponse:
+    return JSONResponse({"code": 503, "message": "服务繁忙，请稍后再试"}, status_code=503)
+
+
 def check_rate_limit(ip: str) -> tuple[bool, str]:
     """检查请求频率限制"""
     now = time.time()
@@ -289,23 +1010,205 @@ def reset_login_attempts(ip: str):
         login_attempts[ip]["locked_until"] = None
 
 
-def check_user_agent(user_agent: str) -> tuple[bool, str]:
+def compile_ua_patterns(patterns: list[str]) -> re.Pattern | None:
+    """将子串规则编译为单个正则"""
+    patterns = [p.lower() for p in patterns if p]
+    if not patterns:
+        return None
+    # 长规则优先，避免被短前缀提前截断
+    patterns.sort(key=len, reverse=True)
+    return re.compile("|".join(re.escape(p) for p in patterns))
+
+
+def is_string_list(value) -> bool:
+    return isinstance(value, list) and all(isinstance(item, str) for item in value)
+
+
+class UARuleSet:
+    """编译后的User-Agent规则集，带LRU判定缓存"""
+
+    def __init__(
+        self,
+        deny: list[str],
+        allow: list[str] | None = None,
+        paths: dict[str, dict[str, list[str]]] | None = None,
+        cache_size: int = UA_VERDICT_CACHE_SIZE,
+    ):
+        self.deny = list(deny)
+        self.allow = list(allow or [])
+        self.paths = {prefix: dict(rule) for prefix, rule in (paths or {}).items()}
+        self.cache_size = cache_size
+        self._deny_re = compile_ua_patterns(self.deny)
+        self._allow_re = compile_ua_patterns(self.allow)
+        # 最长前缀优先匹配
+        self._path_rules = [
+            (
+                prefix,
+                compile_ua_patterns(rule.get("allow", [])),
+                compile_ua_patterns(rule.get("deny", [])),
+            )
+            for prefix, rule in sorted(
+                self.paths.items(), key=lambda item: len(item[0]), reverse=True
+            )
+        ]
+        self._cache: OrderedDict[tuple[str, str], tuple[bool, str]] = OrderedDict()
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "UARuleSet":
+        if not isinstance(data, dict):
+            raise ValueError("规则必须为JSON对象")
+        deny = data.get("deny", SUSPICIOUS_UA_PATTERNS)
+        allow = data.get("allow", [])
+        paths = data.get("paths", {})
+        if not is_string_list(deny) or not is_string_list(allow):
+            raise ValueError("deny/allow 必须为字符串列表")
+        if not isinstance(paths, dict):
+            raise ValueError("paths 必须为对象")
+        for prefix, rule in paths.items():
+            if not isinstance(rule, dict) or not all(
+                key in {"allow", "deny"} and is_string_list(value) for key, value in rule.items()
+            ):
+                raise ValueError(f"paths[{prefix!r}] 必须为包含 allow/deny 字符串列表的对象")
+        return cls(deny=deny, allow=allow, paths=paths)
+
+    def to_dict(self) -> dict:
+        return {"deny": self.deny, "allow": self.allow, "paths": self.paths}
+
+    def classify(self, user_agent: str, path: str = "") -> tuple[bool, str]:
+        if not user_agent:
+            return False, "缺少User-Agent"
+
+        path_allow_re = path_deny_re = None
+        rule_key = ""
+        for prefix, allow_re, deny_re in self._path_rules:
+            if path.startswith(prefix):
+                rule_key, path_allow_re, path_deny_re = prefix, allow_re, deny_re
+                break
+
+        key = (rule_key, user_agent)
+        verdict = self._cache.get(key)
+        if verdict is not None:
+            self._cache.move_to_end(key)
+            CACHE_REQUESTS.inc("ua_verdict", "hit")
+            return verdict
+        CACHE_REQUESTS.inc("ua_verdict", "miss")
+
+        ua_lower = user_agent.lower()
+        if (path_allow_re and path_allow_re.search(ua_lower)) or (
+            self._allow_re and self._allow_re.search(ua_lower)
+        ):
+            verdict = (True, "")
+        elif (path_deny_re and path_deny_re.search(ua_lower)) or (
+            self._deny_re and self._deny_re.search(ua_lower)
+        ):
+            verdict = (False, "检测到异常User-Agent")
+        else:
+            verdict = (True, "")
+
+        self._cache[key] = verdict
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return verdict
+
+
+def load_ua_rules() -> UARuleSet:
+    """加载User-Agent规则，规则文件优先于代码默认值"""
+    if UA_RULES_PATH and os.path.exists(UA_RULES_PATH):
+        with open(UA_RULES_PATH, encoding="utf-8") as f:
+            return UARuleSet.from_dict(json.load(f))
+    return UARuleSet(
+        deny=SUSPICIOUS_UA_PATTERNS, allow=ALLOWED_UA_PATTERNS, paths=UA_PATH_RULES
+    )
+
+
+ua_rules = load_ua_rules()
+
+
+def check_user_agent(user_agent: str, path: str = "") -> tuple[bool, str]:
     """检查User-Agent"""
-    if not user_agent:
-        return False, "缺少User-Agent"
-    
-    ua_lower = user_agent.lower()
-    for pattern in SUSPICIOUS_UA_PATTERNS:
-        if pattern in ua_lower:
-            return False, "检测到异常User-Agent"
-    
-    return True, ""
+    return ua_rules.classify(user_agent, path)
+
+
+class RoutePolicy:
+    """单条路由的中间件策略"""
+
+    __slots__ = ("checks", "log_sample", "blacklist", "user_agent", "rate_limit", "login_lockout")
+
+    def __init__(self, checks: list[str], log_sample: float = 1.0):
+        unknown = set(checks) - {"blacklist", "user_agent", "rate_limit", "login_lockout"}
+        if unknown:
+            raise ValueError(f"未知的检查项：{', '.join(sorted(unknown))}")
+        self.checks = tuple(checks)
+        self.log_sample = max(0.0, min(1.0, float(log_sample)))
+        self.blacklist = "blacklist" in checks
+        self.user_agent = "user_agent" in checks
+        self.rate_limit = "rate_limit" in checks
+        self.login_lockout = "login_lockout" in checks
+
+    def should_log(self) -> bool:
+        if self.log_sample >= 1.0:
+            return True
+        return self.log_sample > 0.0 and random.random() < self.log_sample
+
+
+class RoutePolicyTable:
+    """启动时编译的路由策略表，按方法和路径前缀查找"""
+
+    def __init__(self, policies: list[dict]):
+        # {method: {prefix: RoutePolicy}}，"*" 表示任意方法
+        self._tables: dict[str, dict[str, RoutePolicy]] = {}
+        for item in policies:
+            policy = RoutePolicy(item.get("checks", []), item.get("log_sample", 1.0))
+            for method in item.get("methods") or ["*"]:
+                self._tables.setdefault(method.upper(), {}).setdefault(item["prefix"], policy)
+        # 每个方法下按前缀长度倒序，查找时只需对各长度做一次字典命中
+        self._lengths = {
+            method: sorted({len(prefix) for prefix in table}, reverse=True)
+            for method, table in self._tables.items()
+        }
+        self._default = RoutePolicy(["blacklist", "user_agent"])
+
+    def _match(self, method: str, path: str) -> RoutePolicy | None:
+        table = self._tables.get(method)
+        if not table:
+            return None
+        for length in self._lengths[method]:
+            policy = table.get(path[:length]) if len(path) >= length else None
+            if policy is not None:
+                return policy
+        return None
+
+    def lookup(self, method: str, path: str, preflight: bool = False) -> RoutePolicy:
+        if method == "OPTIONS" and not preflight:
+            return self._match("*", path) or self._default
+        return self._match(method, path) or self._match("*", path) or self._default
+
+
+route_policies = RoutePolicyTable(ROUTE_POLICIES)
 
 
 @app.on_event("startup")
 def startup() -> None:
     init_db()
     init_rate_limit_table()
+    password_hasher.start()
+
+
+@app.on_event("startup")
+async def start_background_tasks() -> None:
+    prewarm_scheduler.start()
+    access_log_rotator.start()
+
+
+@app.on_event("shutdown")
+def shutdown() -> None:
+    password_hasher.shutdown()
+
+
+@app.on_event("shutdown")
+async def stop_background_tasks() -> None:
+    await prewarm_scheduler.stop()
+    await access_log_rotator.stop()
 
 
 def init_rate_limit_table() -> None:
@@ -337,6 +1240,9 @@ def init_rate_limit_table() -> None:
             )
             """
         )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_access_logs_created ON access_logs(created_at)"
+        )
         conn.commit()
 
 
@@ -345,7 +1251,7 @@ def get_username_from_token(request: Request) -> str | None:
     token = auth_header.replace("Bearer ", "").strip()
     if not token:
         return None
-    with get_conn() as conn:
+    with trace_span("session"), get_conn() as conn:
         row = conn.execute(
             "SELECT username FROM sessions WHERE token = ?",
             (token,),
@@ -357,8 +1263,25 @@ async def forward_request(
     path: str, params: list[tuple[str, str]] | None = None, follow_redirects: bool = True
 ) -> httpx.Response:
     url = f"{BASE_URL}{path}"
-    async with httpx.AsyncClient(follow_redirects=follow_redirects, timeout=20) as client:
-        return await client.get(url, params=params)
+    query = dict(params or [])
+    request_type = query.get("type", "")
+    source = query.get("source", "")
+    labels = (
+        path,
+        request_type if request_type in UPSTREAM_METRIC_TYPES else "other",
+        source if source in UPSTREAM_METRIC_SOURCES else "other",
+    )
+    start = time.perf_counter()
+    try:
+        async with httpx.AsyncClient(follow_redirects=follow_redirects, timeout=20) as client:
+            return await client.get(url, params=params)
+    except httpx.HTTPError:
+        UPSTREAM_ERRORS.inc(*labels)
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        UPSTREAM_LATENCY.observe(duration, *labels)
+        record_span("upstream", duration)
 
 
 def build_response(upstream: httpx.Response) -> Response:
@@ -370,27 +1293,727 @@ def build_response(upstream: httpx.Response) -> Response:
     )
 
 
-@app.get("/api/")
-async def api_proxy(request: Request):
-    params = list(request.query_params.multi_items())
-    request_type = request.query_params.get("type", "")
+class UpstreamCache:
+    """上游响应的两级缓存
+
+    第一级是进程内LRU，第二级是独立的SQLite文件（WAL模式），首次访问时才打开。
+    磁盘按总大小淘汰：先删过期条目，再按最近访问时间删除最旧的条目。
+    """
+
+    def __init__(self, path: str, max_bytes: int, memory_entries: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+        self._memory: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._conn: sqlite3.Connection | None = None
+        self._writes = 0
+
+    def _get_conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(
+                self.path, check_same_thread=False, timeout=5, factory=TimedConnection
+            )
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS upstream_cache (
+                    key TEXT PRIMARY KEY,
+                    status INTEGER NOT NULL,
+                    media_type TEXT NOT NULL,
+                    headers TEXT NOT NULL,
+                    body BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    expires_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_upstream_cache_access ON upstream_cache(last_access)"
+            )
+            # 压缩副本：raw_crc 对应生成时的原始内容，原始条目被覆盖后旧副本不再使用
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS upstream_cache_variants (
+                    key TEXT NOT NULL,
+                    encoding TEXT NOT NULL,
+                    raw_crc INTEGER NOT NULL,
+                    body BLOB NOT NULL,
+                    PRIMARY KEY (key, encoding)
+                )
+                """
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _remember(self, key: str, entry: dict, expires_at: float) -> None:
+        self._memory[key] = (expires_at, entry)
+        self._memory.move_to_end(key)
+        if len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> dict | None:
+        now = time.time()
+        item = self._memory.get(key)
+        if item is not None:
+            if item[0] > now:
+                self._memory.move_to_end(key)
+                CACHE_REQUESTS.inc("upstream_memory", "hit")
+                return item[1]
+            del self._memory[key]
+        CACHE_REQUESTS.inc("upstream_memory", "miss")
+
+        # 磁盘缓存出错时按未命中处理，不影响代理本身
+        try:
+            conn = self._get_conn()
+            row = conn.execute(
+                """
+                SELECT status, media_type, headers, body, expires_at, last_access
+                FROM upstream_cache WHERE key = ?
+                """,
+                (key,),
+            ).fetchone()
+            if row is None or row["expires_at"] <= now:
+                CACHE_REQUESTS.inc("upstream_disk", "miss")
+                return None
+            # 访问时间只做粗粒度更新，避免每次命中都写库
+            if now - row["last_access"] > 60:
+                conn.execute("UPDATE upstream_cache SET last_access = ? WHERE key = ?", (now, key))
+                conn.commit()
+        except sqlite3.Error:
+            CACHE_REQUESTS.inc("upstream_disk", "error")
+            return None
+
+        entry = {
+            "status": row["status"],
+            "media_type": row["media_type"],
+            "headers": json.loads(row["headers"]),
+            "body": row["body"],
+        }
+        self._remember(key, entry, row["expires_at"])
+        CACHE_REQUESTS.inc("upstream_disk", "hit")
+        return entry
+
+    def set(self, key: str, entry: dict, ttl: int) -> None:
+        now = time.time()
+        expires_at = now + ttl
+        self._remember(key, entry, expires_at)
+        try:
+            conn = self._get_conn()
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO upstream_cache
+                    (key, status, media_type, headers, body, size, created_at, expires_at, last_access)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    key,
+                    entry["status"],
+                    entry["media_type"],
+                    json.dumps(entry["headers"]),
+                    entry["body"],
+                    len(entry["body"]) + len(key),
+                    now,
+                    expires_at,
+                    now,
+                ),
+            )
+            conn.execute("DELETE FROM upstream_cache_variants WHERE key = ?", (key,))
+            conn.commit()
+            self._writes += 1
+            if self._writes % UPSTREAM_CACHE_EVICT_EVERY == 0:
+                self.evict()
+        except sqlite3.Error:
+            CACHE_REQUESTS.inc("upstream_disk", "error")
+
+    def evict(self) -> None:
+        conn = self._get_conn()
+        conn.execute("DELETE FROM upstream_cache WHERE expires_at <= ?", (time.time(),))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) AS total FROM upstream_cache").fetchone()["total"]
+        # 超出上限时按最近访问时间淘汰到上限的90%
+        target = self.max_bytes * 0.9
+        if total > self.max_bytes:
+            while total > target:
+                rows = conn.execute(
+                    "SELECT key, size FROM upstream_cache ORDER BY last_access LIMIT 200"
+                ).fetchall()
+                if not rows:
+                    break
+                keys = []
+                for row in rows:
+                    keys.append((row["key"],))
+                    total -= row["size"]
+                    if total <= target:
+                        break
+                conn.executemany("DELETE FROM upstream_cache WHERE key = ?", keys)
+        conn.execute(
+            "DELETE FROM upstream_cache_variants WHERE key NOT IN (SELECT key FROM upstream_cache)"
+        )
+        conn.commit()
+
+    def get_variant(self, key: str, entry: dict, encoding: str) -> bytes:
+        """返回条目的压缩副本，每个条目每种编码只压缩一次"""
+        variants = entry.setdefault("variants", {})
+        body = variants.get(encoding)
+        if body is not None:
+            CACHE_REQUESTS.inc("upstream_variant", "hit")
+            return body
+
+        raw_crc = zlib.crc32(entry["body"])
+        try:
+            conn = self._get_conn()
+            row = conn.execute(
+                "SELECT raw_crc, body FROM upstream_cache_variants WHERE key = ? AND encoding = ?",
+                (key, encoding),
+            ).fetchone()
+        except sqlite3.Error:
+            CACHE_REQUESTS.inc("upstream_variant", "error")
+            row = None
+        if row is not None and row["raw_crc"] == raw_crc:
+            variants[encoding] = row["body"]
+            CACHE_REQUESTS.inc("upstream_variant", "hit")
+            return row["body"]
+
+        CACHE_REQUESTS.inc("upstream_variant", "miss")
+        body = compress_body(entry["body"], encoding, "cached")
+        variants[encoding] = body
+        try:
+            conn = self._get_conn()
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO upstream_cache_variants (key, encoding, raw_crc, body)
+                VALUES (?, ?, ?, ?)
+                """,
+                (key, encoding, raw_crc, body),
+            )
+            # 副本计入条目大小，参与磁盘淘汰；按当前内容重新计算，重复生成时不会累加
+            conn.execute(
+                """
+                UPDATE upstream_cache SET size = length(body) + length(key) + (
+                    SELECT COALESCE(SUM(length(body)), 0) FROM upstream_cache_variants WHERE key = ?
+                )
+                WHERE key = ?
+                """,
+                (key, key),
+            )
+            conn.commit()
+        except sqlite3.Error:
+            CACHE_REQUESTS.inc("upstream_variant", "error")
+        return body
+
+    def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        """在缓存文件中抢占或续期租约，同机多worker只有一个能拿到"""
+        now = time.time()
+        conn = self._get_conn()
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS leases (
+                name TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+            """
+        )
+        conn.execute(
+            """
+            INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+            WHERE leases.owner = excluded.owner OR leases.expires_at < ?
+            """,
+            (name, owner, now + ttl, now),
+        )
+        conn.commit()
+        row = conn.execute("SELECT owner FROM leases WHERE name = ?", (name,)).fetchone()
+        return row is not None and row["owner"] == owner
+
+    def release_lease(self, name: str, owner: str) -> None:
+        conn = self._get_conn()
+        conn.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner))
+        conn.commit()
+
+    def stats(self) -> dict:
+        row = self._get_conn().execute(
+            "SELECT COUNT(*) AS entries, COALESCE(SUM(size), 0) AS bytes FROM upstream_cache"
+        ).fetchone()
+        return {
+            "path": self.path,
+            "memory_entries": len(self._memory),
+            "disk_entries": row["entries"],
+            "disk_bytes": row["bytes"],
+            "max_bytes": self.max_bytes,
+        }
+
+    def clear(self) -> None:
+        self._memory.clear()
+        conn = self._get_conn()
+        conn.execute("DELETE FROM upstream_cache")
+        conn.execute("DELETE FROM upstream_cache_variants")
+        conn.commit()
+
+    async def fetch_once(self, key: str, loader, ttl: int) -> dict:
+        """同一进程内相同key的并发未命中只请求一次上游"""
+        future = self._inflight.get(key)
+        if future is not None:
+            try:
+                return await asyncio.wait_for(asyncio.shield(future), UPSTREAM_CACHE_WAIT_TIMEOUT)
+            except asyncio.TimeoutError:
+                pass
+            except asyncio.CancelledError:
+                # 只处理首个请求被取消的情况，自身被取消时照常抛出
+                if not future.cancelled():
+                    raise
+            # 首个请求超时或被取消（例如客户端断开），改为自行请求上游
+            entry = await loader()
+        else:
+            future = asyncio.get_running_loop().create_future()
+            self._inflight[key] = future
+            try:
+                entry = await loader()
+            except BaseException as exc:
+                if isinstance(exc, asyncio.CancelledError):
+                    future.cancel()
+                else:
+                    future.set_exception(exc)
+                    # 没有其他等待者时避免 "exception was never retrieved" 警告
+                    future.exception()
+                raise
+            finally:
+                if self._inflight.get(key) is future:
+                    del self._inflight[key]
+            future.set_result(entry)
+        if is_cacheable(entry):
+            self.set(key, entry, ttl)
+        return entry
+
+
+upstream_cache = UpstreamCache(
+    UPSTREAM_CACHE_PATH, UPSTREAM_CACHE_MAX_BYTES, UPSTREAM_CACHE_MEMORY_ENTRIES
+)
+
+
+def upstream_cache_key(params: list[tuple[str, str]]) -> str:
+    # 必须编码参数值，否则值中的 & 和 = 会让不同的查询得到相同的key
+    return "/api/?" + urlencode(sorted(params))
+
+
+def is_cacheable(entry: dict) -> bool:
+    """只缓存成功的响应；JSON响应还要求业务码为200"""
+    if entry["status"] == 302:
+        return "location" in entry["headers"]
+    if entry["status"] != 200:
+        return False
+    if "json" in entry["media_type"]:
+        try:
+            return json.loads(entry["body"]).get("code") == 200
+        except (ValueError, AttributeError):
+            return False
+    return True
+
 
+async def fetch_upstream_entry(request_type: str, params: list[tuple[str, str]]) -> dict:
+    """请求上游并转换为可缓存的响应记录"""
     if request_type in {"url", "pic"}:
         upstream = await forward_request("/api/", params=params, follow_redirects=False)
         location = upstream.headers.get("location")
         if location:
-            headers = {}
+            headers = {"location": location}
             if "x-source-switch" in upstream.headers:
                 headers["x-source-switch"] = upstream.headers["x-source-switch"]
-            return RedirectResponse(url=location, status_code=302, headers=headers)
-        return build_response(upstream)
-
-    if request_type == "lrc":
+            return {"status": 302, "media_type": "", "headers": headers, "body": b""}
+    elif request_type == "lrc":
+        upstream = await forward_request("/api/", params=params, follow_redirects=True)
+        return {
+            "status": upstream.status_code,
+            "media_type": "text/plain; charset=utf-8",
+            "headers": {},
+            "body": upstream.text.encode("utf-8"),
+        }
+    else:
         upstream = await forward_request("/api/", params=params, follow_redirects=True)
-        return PlainTextResponse(content=upstream.text, status_code=upstream.status_code)
+    return {
+        "status": upstream.status_code,
+        "media_type": upstream.headers.get("content-type", "application/json"),
+        "headers": {},
+        "body": upstream.content,
+    }
 
-    upstream = await forward_request("/api/", params=params, follow_redirects=True)
-    return build_response(upstream)
+
+def entry_to_response(entry: dict) -> Response:
+    if entry["status"] == 302:
+        headers = {k: v for k, v in entry["headers"].items() if k != "location"}
+        return RedirectResponse(url=entry["headers"]["location"], status_code=302, headers=headers)
+    return Response(content=entry["body"], status_code=entry["status"], media_type=entry["media_type"])
+
+
+def cached_entry_response(request: Request, key: str, entry: dict) -> Response:
+    """缓存条目可压缩时直接返回缓存的压缩副本"""
+    if entry["status"] != 200 or not is_compressible(entry["media_type"], len(entry["body"])):
+        return entry_to_response(entry)
+    encoding = choose_encoding(request.headers.get("accept-encoding", ""))
+    if encoding is None:
+        return entry_to_response(entry)
+    with trace_span("compress"):
+        body = upstream_cache.get_variant(key, entry, encoding)
+    return Response(
+        content=body,
+        media_type=entry["media_type"],
+        headers={"Content-Encoding": encoding, "Vary": "Accept-Encoding"},
+    )
+
+
+def pinyin_text(text: str) -> str:
+    """生成全拼和首字母，如 "周杰伦" -> "zhoujielun zjl" """
+    if lazy_pinyin is None or not text:
+        return ""
+    syllables = [s.strip() for s in lazy_pinyin(text) if s.strip()]
+    full = "".join(syllables).lower()
+    initials = "".join(s[0] for s in syllables).lower()
+    return f"{full} {initials}"
+
+
+def extract_tracks(request_type: str, params: list[tuple[str, str]], entry: dict) -> list[dict]:
+    """从搜索、榜单、歌单响应中提取歌曲"""
+    if request_type not in {"search", "aggregateSearch", "toplist", "playlist"}:
+        return []
+    if entry["status"] != 200:
+        return []
+    try:
+        data = json.loads(entry["body"]).get("data") or {}
+    except (ValueError, AttributeError):
+        return []
+    if not isinstance(data, dict):
+        return []
+    items = data.get("results") if request_type in {"search", "aggregateSearch"} else data.get("list")
+    if not isinstance(items, list):
+        return []
+    default_source = data.get("source") or dict(params).get("source", "")
+    tracks = []
+    for item in items:
+        if not isinstance(item, dict) or not item.get("id") or not item.get("name"):
+            continue
+        artist = item.get("artist") or ""
+        if isinstance(artist, list):
+            artist = "/".join(str(a) for a in artist)
+        tracks.append({
+            "id": str(item["id"]),
+            "source": item.get("platform") or default_source,
+            "name": str(item["name"]),
+            "artist": str(artist),
+            "album": str(item.get("album") or ""),
+        })
+    return tracks
+
+
+class TrackIndex:
+    """已见歌曲的本地全文索引（SQLite FTS5），用于搜索输入联想
+
+    使用独立的数据库文件，首次访问时打开，并从收藏表导入已有歌曲。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: sqlite3.Connection | None = None
+
+    def _get_conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(
+                self.path, check_same_thread=False, timeout=5, factory=TimedConnection
+            )
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS tracks (
+                    id INTEGER PRIMARY KEY,
+                    source TEXT NOT NULL,
+                    track_id TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    artist TEXT NOT NULL,
+                    album TEXT NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 1,
+                    updated_at REAL NOT NULL,
+                    UNIQUE (source, track_id)
+                )
+                """
+            )
+            conn.execute(
+                """
+                CREATE VIRTUAL TABLE IF NOT EXISTS tracks_fts USING fts5(
+                    name, artist, album, pinyin,
+                    tokenize = 'unicode61 remove_diacritics 2'
+                )
+                """
+            )
+            conn.commit()
+            self._conn = conn
+            if conn.execute("SELECT 1 FROM tracks LIMIT 1").fetchone() is None:
+                self._import_favorites()
+        return self._conn
+
+    def _import_favorites(self) -> None:
+        with get_conn() as conn:
+            rows = conn.execute(
+                "SELECT DISTINCT track_id, source, name, artist FROM favorites"
+            ).fetchall()
+        self.add_tracks([
+            {"id": row["track_id"], "source": row["source"], "name": row["name"],
+             "artist": row["artist"], "album": ""}
+            for row in rows
+        ])
+
+    def add_tracks(self, tracks: list[dict], count_hits: bool = True) -> None:
+        """写入或更新歌曲
+
+        榜单、歌单条目通常缺少歌手和专辑，空字段不覆盖已有值。
+        只有搜索和收藏（count_hits=True）累加热度，定时刷新的榜单不影响排序。
+        """
+        if not tracks:
+            return
+        now = time.time()
+        # 索引只是尽力而为：打不开（被锁、缺少FTS5等）时跳过，不影响调用方
+        try:
+            conn = self._get_conn()
+        except (sqlite3.Error, OSError):
+            return
+        try:
+            for track in tracks:
+                row = conn.execute(
+                    "SELECT id, name, artist, album FROM tracks WHERE source = ? AND track_id = ?",
+                    (track["source"], track["id"]),
+                ).fetchone()
+                fields = (track["name"], track["artist"], track["album"])
+                if row is None:
+                    rowid = conn.execute(
+                        """
+                        INSERT INTO tracks (source, track_id, name, artist, album, hits, updated_at)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                        """,
+                        (track["source"], track["id"], *fields, int(count_hits), now),
+                    ).lastrowid
+                else:
+                    rowid = row["id"]
+                    current = (row["name"], row["artist"], row["album"])
+                    fields = tuple(new or old for new, old in zip(fields, current))
+                    conn.execute(
+                        """
+                        UPDATE tracks SET name = ?, artist = ?, album = ?, hits = hits + ?, updated_at = ?
+                        WHERE id = ?
+                        """,
+                        (*fields, int(count_hits), now, rowid),
+                    )
+                    if fields == current:
+                        continue
+                    conn.execute("DELETE FROM tracks_fts WHERE rowid = ?", (rowid,))
+                pinyin = f"{pinyin_text(fields[0])} {pinyin_text(fields[1])}".strip()
+                conn.execute(
+                    "INSERT INTO tracks_fts (rowid, name, artist, album, pinyin) VALUES (?, ?, ?, ?, ?)",
+                    (rowid, *fields, pinyin),
+                )
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+
+    def suggest(self, keyword: str, source: str = "", limit: int = SUGGEST_LIMIT) -> list[dict]:
+        """按前缀匹配歌名、歌手、专辑或拼音，热度高的优先"""
+        tokens = re.findall(r"\w+", keyword.lower())[:8]
+        if not tokens:
+            return []
+        query = " ".join(f'"{token}"*' for token in tokens)
+        sql = """
+            SELECT t.track_id, t.source, t.name, t.artist, t.album
+            FROM tracks_fts JOIN tracks t ON t.id = tracks_fts.rowid
+            WHERE tracks_fts MATCH ?
+        """
+        args: list = [query]
+        if source:
+            sql += " AND t.source = ?"
+            args.append(source)
+        sql += " ORDER BY t.hits DESC, bm25(tracks_fts) LIMIT ?"
+        args.append(limit)
+        rows = self._get_conn().execute(sql, args).fetchall()
+        return [
+            {
+                "id": row["track_id"],
+                "source": row["source"],
+                "name": row["name"],
+                "artist": row["artist"],
+                "album": row["album"],
+            }
+            for row in rows
+        ]
+
+
+track_index = TrackIndex(SEARCH_INDEX_PATH)
+
+
+async def fetch_and_index_upstream(request_type: str, params: list[tuple[str, str]]) -> dict:
+    """请求上游，并把响应中的歌曲加入搜索建议索引"""
+    entry = await fetch_upstream_entry(request_type, params)
+    with trace_span("index"):
+        track_index.add_tracks(
+            extract_tracks(request_type, params, entry),
+            count_hits=request_type in {"search", "aggregateSearch"},
+        )
+    return entry
+
+
+async def warm_upstream(params: list[tuple[str, str]]) -> dict:
+    """强制请求上游并写入缓存"""
+    request_type = dict(params)["type"]
+    return await upstream_cache.fetch_once(
+        upstream_cache_key(params),
+        partial(fetch_and_index_upstream, request_type, params),
+        UPSTREAM_CACHE_TTLS[request_type],
+    )
+
+
+def entry_list(entry: dict) -> list:
+    """取出上游JSON响应中的 data.list，结构不符时返回空列表"""
+    try:
+        data = json.loads(entry["body"]).get("data")
+    except (ValueError, AttributeError):
+        return []
+    items = data.get("list") if isinstance(data, dict) else None
+    return items if isinstance(items, list) else []
+
+
+class PrewarmScheduler:
+    """后台定时预热榜单缓存
+
+    每轮刷新各平台的榜单列表、前几个榜单的歌曲和部分歌曲封面跳转。
+    同机多个worker通过缓存文件中的租约选出一个执行。
+    """
+
+    def __init__(self):
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}"
+        self.last_run: dict = {}
+        self._running = False
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if PREWARM_ENABLED and self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self) -> None:
+        # 启动后稍等片刻再开始，错开同时启动的实例
+        await asyncio.sleep(random.uniform(1, 10))
+        while True:
+            interval = PREWARM_INTERVAL * random.uniform(1 - PREWARM_JITTER, 1 + PREWARM_JITTER)
+            try:
+                # 租约覆盖到下一轮之后，leader退出后其他worker会在租约过期后接手
+                if upstream_cache.acquire_lease("prewarm", self.owner, PREWARM_INTERVAL * 2):
+                    await self.run_once()
+            except Exception:
+                # 单轮失败不能结束后台任务，记录后等待下一轮
+                logger.exception("榜单预热失败")
+            await asyncio.sleep(interval)
+
+    async def run_once(self) -> dict | None:
+        """执行一轮预热；本进程或同机其他worker正在预热时返回 None"""
+        if self._running:
+            return None
+        # 定时任务和手动触发可能落在不同worker上，用短租约保证同一时间只有一轮在请求上游
+        if not upstream_cache.acquire_lease("prewarm_run", self.owner, 600):
+            return None
+        self._running = True
+        try:
+            return await self._run()
+        finally:
+            self._running = False
+            upstream_cache.release_lease("prewarm_run", self.owner)
+
+    async def _run(self) -> dict:
+        start = time.time()
+        semaphore = asyncio.Semaphore(PREWARM_CONCURRENCY)
+        counts = {"ok": 0, "error": 0}
+
+        async def warm(params: list[tuple[str, str]]) -> dict | None:
+            request_type = dict(params)["type"]
+            async with semaphore:
+                try:
+                    entry = await warm_upstream(params)
+                except Exception:
+                    logger.warning("预热请求失败：%s", params, exc_info=True)
+                    entry = None
+            result = "ok" if entry is not None and is_cacheable(entry) else "error"
+            counts[result] += 1
+            PREWARM_REQUESTS.inc(request_type, result)
+            return entry if result == "ok" else None
+
+        toplists = await asyncio.gather(*[
+            warm([("type", "toplists"), ("source", source)]) for source in PREWARM_SOURCES
+        ])
+        chart_params = []
+        for source, entry in zip(PREWARM_SOURCES, toplists):
+            if entry is None:
+                continue
+            charts = entry_list(entry)
+            chart_params += [
+                [("type", "toplist"), ("source", source), ("id", str(chart["id"]))]
+                for chart in charts[:PREWARM_TOP_CHARTS]
+                if isinstance(chart, dict) and chart.get("id")
+            ]
+        charts = await asyncio.gather(*[warm(params) for params in chart_params])
+
+        cover_params = []
+        for params, entry in zip(chart_params, charts):
+            if entry is None:
+                continue
+            source = dict(params)["source"]
+            songs = entry_list(entry)
+            cover_params += [
+                [("source", source), ("id", str(song["id"])), ("type", "pic")]
+                for song in songs[:PREWARM_TOP_COVERS]
+                if isinstance(song, dict) and song.get("id")
+            ]
+        await asyncio.gather(*[warm(params) for params in cover_params])
+
+        self.last_run = {
+            "owner": self.owner,
+            "started_at": datetime.utcfromtimestamp(start).isoformat(),
+            "duration": round(time.time() - start, 3),
+            **counts,
+        }
+        return self.last_run
+
+
+prewarm_scheduler = PrewarmScheduler()
+
+
+@app.get("/api/")
+async def api_proxy(request: Request):
+    params = list(request.query_params.multi_items())
+    request_type = request.query_params.get("type", "")
+
+    ttl = UPSTREAM_CACHE_TTLS.get(request_type)
+    if not ttl:
+        return entry_to_response(await fetch_upstream_entry(request_type, params))
+
+    key = upstream_cache_key(params)
+    with trace_span("cache"):
+        entry = upstream_cache.get(key)
+    if entry is None:
+        entry = await upstream_cache.fetch_once(
+            key, partial(fetch_and_index_upstream, request_type, params), ttl
+        )
+    return cached_entry_response(request, key, entry)
 
 
 @app.post("/auth/register")
@@ -400,8 +2023,10 @@ async def register(payload: AuthPayload):
         return JSONResponse(
             {"code": 400, "message": "用户名或密码不能为空"}, status_code=400
         )
-    salt = secrets.token_hex(8)
-    password_hash = hash_password(payload.password, salt)
+    try:
+        password_hash, salt = await password_hasher.hash(payload.password)
+    except PasswordHasherBusy:
+        return busy_response()
     created_at = datetime.utcnow().isoformat()
     try:
         with get_conn() as conn:
@@ -434,16 +2059,20 @@ async def login(request: Request, payload: AuthPayload):
             (username,),
         ).fetchone()
     
-    if not row:
-        record_failed_login(ip)
-        remaining = MAX_LOGIN_ATTEMPTS - login_attempts[ip]["attempts"]
-        return JSONResponse(
-            {"code": 401, "message": f"账号或密码错误，剩余尝试次数：{remaining}"}, 
-            status_code=401
-        )
-    
-    expected = hash_password(payload.password, row["salt"])
-    if expected != row["password_hash"]:
+    try:
+        if not row:
+            password_ok = await password_hasher.verify_missing(payload.password)
+        else:
+            password_ok = await password_hasher.verify(
+                payload.password, row["password_hash"], row["salt"]
+            )
+        # 旧版或参数过期的哈希在登录成功时顺带升级
+        rehashed = None
+        if password_ok and password_hasher.needs_rehash(row["password_hash"]):
+            rehashed = await password_hasher.hash(payload.password)
+    except PasswordHasherBusy:
+        return busy_response()
+    if not password_ok:
         record_failed_login(ip)
         remaining = MAX_LOGIN_ATTEMPTS - login_attempts[ip]["attempts"]
         return JSONResponse(
@@ -457,6 +2086,11 @@ async def login(request: Request, payload: AuthPayload):
     token = secrets.token_urlsafe(24)
     created_at = datetime.utcnow().isoformat()
     with get_conn() as conn:
+        if rehashed:
+            conn.execute(
+                "UPDATE users SET password_hash = ?, salt = ? WHERE username = ? AND password_hash = ?",
+                (*rehashed, username, row["password_hash"]),
+            )
         conn.execute(
             "INSERT INTO sessions (token, username, created_at) VALUES (?, ?, ?)",
             (token, username, created_at),
@@ -479,6 +2113,92 @@ async def me(request: Request):
     return JSONResponse({"code": 200, "data": {"username": username}})
 
 
+@app.get("/me/bootstrap")
+async def bootstrap(request: Request):
+    """一次返回首屏需要的用户信息、资料、登录日志和收藏"""
+    auth_header = request.headers.get("authorization", "")
+    token = auth_header.replace("Bearer ", "").strip()
+    if not token:
+        return JSONResponse({"code": 401, "message": "未登录"}, status_code=401)
+    with trace_span("bootstrap"), get_conn() as conn:
+        # 在同一个读事务中完成，保证各部分数据来自同一时刻
+        conn.execute("BEGIN")
+        try:
+            user = conn.execute(
+                """
+                SELECT users.username, users.created_at
+                FROM sessions JOIN users ON users.username = sessions.username
+                WHERE sessions.token = ?
+                """,
+                (token,),
+            ).fetchone()
+            if not user:
+                return JSONResponse({"code": 401, "message": "未登录"}, status_code=401)
+            username = user["username"]
+            profile = conn.execute(
+                "SELECT nickname, signature, avatar_url FROM profiles WHERE username = ?",
+                (username,),
+            ).fetchone()
+            logs = conn.execute(
+                """
+                SELECT device, ip, created_at
+                FROM login_logs
+                WHERE username = ?
+                ORDER BY created_at DESC
+                LIMIT 20
+                """,
+                (username,),
+            ).fetchall()
+            favorites = conn.execute(
+                """
+                SELECT track_id, source, name, artist
+                FROM favorites
+                WHERE username = ?
+                ORDER BY created_at DESC
+                LIMIT ?
+                """,
+                (username, BOOTSTRAP_FAVORITES_LIMIT + 1),
+            ).fetchall()
+        finally:
+            conn.rollback()
+
+    data = {
+        "user": {"username": username, "created_at": user["created_at"]},
+        "profile": {
+            "nickname": profile["nickname"] if profile else "",
+            "signature": profile["signature"] if profile else "",
+            "avatar_url": profile["avatar_url"] if profile else "",
+            "username": username,
+        },
+        "logs": [
+            {"device": row["device"], "ip": row["ip"], "time": row["created_at"]}
+            for row in logs
+        ],
+        "favorites": {
+            "list": [
+                {
+                    "id": row["track_id"],
+                    "source": row["source"],
+                    "name": row["name"],
+                    "artist": row["artist"],
+                }
+                for row in favorites[:BOOTSTRAP_FAVORITES_LIMIT]
+            ],
+            "has_more": len(favorites) > BOOTSTRAP_FAVORITES_LIMIT,
+        },
+    }
+    headers = {"Cache-Control": "private, no-cache", "Vary": "Authorization"}
+    response = JSONResponse({"code": 200, "data": data}, headers=headers)
+    etag = f'"{hashlib.sha256(response.body).hexdigest()[:32]}"'
+    if_none_match = request.headers.get("if-none-match", "")
+    if if_none_match.strip() == "*" or etag in [
+        tag.strip().removeprefix("W/") for tag in if_none_match.split(",")
+    ]:
+        return Response(status_code=304, headers={**headers, "ETag": etag})
+    response.headers["ETag"] = etag
+    return response
+
+
 @app.post("/auth/logout")
 async def logout(request: Request):
     auth_header = request.headers.get("authorization", "")
@@ -501,11 +2221,17 @@ async def delete_account(request: Request, payload: DeleteAccountPayload):
             "SELECT password_hash, salt FROM users WHERE username = ?",
             (username,),
         ).fetchone()
-        if not row:
-            return JSONResponse({"code": 404, "message": "账号不存在"}, status_code=404)
-        expected = hash_password(payload.password, row["salt"])
-        if expected != row["password_hash"]:
-            return JSONResponse({"code": 400, "message": "密码错误"}, status_code=400)
+    if not row:
+        return JSONResponse({"code": 404, "message": "账号不存在"}, status_code=404)
+    try:
+        password_ok = await password_hasher.verify(
+            payload.password, row["password_hash"], row["salt"]
+        )
+    except PasswordHasherBusy:
+        return busy_response()
+    if not password_ok:
+        return JSONResponse({"code": 400, "message": "密码错误"}, status_code=400)
+    with get_conn() as conn:
         conn.execute("DELETE FROM sessions WHERE username = ?", (username,))
         conn.execute("DELETE FROM favorites WHERE username = ?", (username,))
         conn.execute("DELETE FROM profiles WHERE username = ?", (username,))
@@ -600,12 +2326,17 @@ async def change_password(request: Request, payload: PasswordPayload):
             "SELECT password_hash, salt FROM users WHERE username = ?",
             (username,),
         ).fetchone()
-        if not row:
-            return JSONResponse({"code": 404, "message": "用户不存在"}, status_code=404)
-        if hash_password(payload.current_password, row["salt"]) != row["password_hash"]:
+    if not row:
+        return JSONResponse({"code": 404, "message": "用户不存在"}, status_code=404)
+    try:
+        if not await password_hasher.verify(
+            payload.current_password, row["password_hash"], row["salt"]
+        ):
             return JSONResponse({"code": 400, "message": "原密码错误"}, status_code=400)
-        new_salt = secrets.token_hex(8)
-        new_hash = hash_password(payload.new_password, new_salt)
+        new_hash, new_salt = await password_hasher.hash(payload.new_password)
+    except PasswordHasherBusy:
+        return busy_response()
+    with get_conn() as conn:
         conn.execute(
             "UPDATE users SET password_hash = ?, salt = ? WHERE username = ?",
             (new_hash, new_salt, username),
@@ -663,6 +2394,13 @@ async def add_favorite(request: Request, payload: FavoritePayload):
             ),
         )
         conn.commit()
+    track_index.add_tracks([{
+        "id": payload.id,
+        "source": payload.source,
+        "name": payload.name,
+        "artist": payload.artist,
+        "album": "",
+    }])
     return JSONResponse({"code": 200, "message": "已收藏"})
 
 
@@ -684,6 +2422,20 @@ async def remove_favorite(request: Request):
     return JSONResponse({"code": 200, "message": "已取消收藏"})
 
 
+@app.get("/suggest")
+async def suggest(keyword: str = "", source: str = "", limit: int = SUGGEST_LIMIT):
+    """搜索输入联想，只查询本地索引"""
+    keyword = keyword.strip()
+    if not keyword:
+        return JSONResponse({"code": 200, "data": {"keyword": "", "results": []}})
+    limit = max(1, min(limit, SUGGEST_MAX_LIMIT))
+    try:
+        results = track_index.suggest(keyword, source, limit)
+    except sqlite3.Error:
+        results = []
+    return JSONResponse({"code": 200, "data": {"keyword": keyword, "results": results}})
+
+
 @app.get("/status")
 async def status():
     return JSONResponse(
@@ -706,6 +2458,12 @@ async def health_check():
     return JSONResponse({"code": 200, "data": {"status": "healthy"}})
 
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus文本格式的运行指标"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/stats")
 async def stats(request: Request):
     params = list(request.query_params.multi_items())
@@ -748,15 +2506,341 @@ async def stats_types(request: Request):
     return build_response(upstream)
 
 
+# ==================== 访问日志归档 ====================
+
+ACCESS_LOG_COLUMNS = ("id", "ip", "path", "method", "user_agent", "status_code", "created_at", "blocked")
+# 取值重复度高的列使用字典编码
+DICT_COLUMNS = {"ip", "path", "method", "user_agent"}
+
+
+class AccessLogArchive:
+    """按天存放的访问日志段文件
+
+    文件格式：魔数 + 头部长度 + JSON头部（行数、时间和IP范围、拦截数、各列位置）+ 各列数据。
+    每列单独用 zlib 压缩，查询只解压需要的列；头部用于跳过不相关的段。
+    """
+
+    MAGIC = b"HBLOGSEG1"
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._headers: dict[str, tuple[float, dict]] = {}
+
+    def _path(self, day: str) -> str:
+        return os.path.join(self.directory, f"access-{day}.seg")
+
+    def exists(self, day: str) -> bool:
+        return os.path.exists(self._path(day))
+
+    def write(self, day: str, rows: Iterable[dict]) -> dict | None:
+        """按批写入一天的日志，rows 需按 (created_at, id) 排好序；没有数据时返回 None
+
+        各列边读边压缩，内存中只保留一批原始记录和压缩后的数据。
+        """
+        header: dict = {"day": day, "rows": 0, "blocked": 0, "columns": {}}
+        compressors = {name: zlib.compressobj(9) for name in ACCESS_LOG_COLUMNS}
+        pieces: dict[str, list[bytes]] = {name: [] for name in ACCESS_LOG_COLUMNS}
+        codes: dict[str, dict] = {name: {} for name in DICT_COLUMNS}
+        ips: set[str] = set()
+        rows = iter(rows)
+        while batch := list(islice(rows, ACCESS_LOG_ROTATE_BATCH)):
+            for name in ACCESS_LOG_COLUMNS:
+                values = [row[name] for row in batch]
+                if name in DICT_COLUMNS:
+                    values = [codes[name].setdefault(value, len(codes[name])) for value in values]
+                text = json.dumps(values, ensure_ascii=False)[1:-1]
+                if header["rows"] == 0:
+                    # 字典编码列写成 {"codes": [...], "values": [...]}，取值表在最后写入
+                    text = ('{"codes":[' if name in DICT_COLUMNS else "[") + text
+                else:
+                    text = "," + text
+                pieces[name].append(compressors[name].compress(text.encode("utf-8")))
+            if header["rows"] == 0:
+                header["min_time"] = batch[0]["created_at"]
+                header["min_id"] = header["max_id"] = batch[0]["id"]
+                header["min_ip"] = header["max_ip"] = batch[0]["ip"]
+            header["rows"] += len(batch)
+            header["max_time"] = batch[-1]["created_at"]
+            header["min_id"] = min(header["min_id"], *(row["id"] for row in batch))
+            header["max_id"] = max(header["max_id"], *(row["id"] for row in batch))
+            header["min_ip"] = min(header["min_ip"], *(row["ip"] for row in batch))
+            header["max_ip"] = max(header["max_ip"], *(row["ip"] for row in batch))
+            header["blocked"] += sum(1 for row in batch if row["blocked"])
+            ips.update(row["ip"] for row in batch)
+        if header["rows"] == 0:
+            return None
+        header["ip_count"] = len(ips)
+
+        blobs = []
+        offset = 0
+        for name in ACCESS_LOG_COLUMNS:
+            if name in DICT_COLUMNS:
+                tail = '],"values":' + json.dumps(list(codes[name]), ensure_ascii=False) + "}"
+            else:
+                tail = "]"
+            blob = b"".join(pieces[name]) + compressors[name].compress(tail.encode("utf-8"))
+            blob += compressors[name].flush()
+            header["columns"][name] = [offset, len(blob)]
+            blobs.append(blob)
+            offset += len(blob)
+
+        os.makedirs(self.directory, exist_ok=True)
+        header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+        path = self._path(day)
+        # 先写临时文件再替换，查询不会读到写了一半的段
+        tmp_path = f"{path}.{os.getpid()}.{secrets.token_hex(4)}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(self.MAGIC)
+            f.write(struct.pack(">I", len(header_bytes)))
+            f.write(header_bytes)
+            for blob in blobs:
+                f.write(blob)
+        os.replace(tmp_path, path)
+        return header
+
+    def _read_header(self, path: str) -> dict:
+        mtime = os.path.getmtime(path)
+        cached = self._headers.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        with open(path, "rb") as f:
+            if f.read(len(self.MAGIC)) != self.MAGIC:
+                raise ValueError(f"不是访问日志段文件：{path}")
+            (length,) = struct.unpack(">I", f.read(4))
+            header = json.loads(f.read(length))
+        header["data_offset"] = len(self.MAGIC) + 4 + length
+        self._headers[path] = (mtime, header)
+        return header
+
+    def segments(self) -> list[dict]:
+        """所有段的头部，按日期从新到旧排列"""
+        if not os.path.isdir(self.directory):
+            return []
+        headers = []
+        for name in sorted(os.listdir(self.directory), reverse=True):
+            if name.startswith("access-") and name.endswith(".seg"):
+                headers.append(self._read_header(os.path.join(self.directory, name)))
+        return headers
+
+    def read_columns(self, day: str, names: tuple[str, ...]) -> dict[str, list]:
+        path = self._path(day)
+        header = self._read_header(path)
+        columns = {}
+        with open(path, "rb") as f:
+            for name in names:
+                offset, length = header["columns"][name]
+                f.seek(header["data_offset"] + offset)
+                values = json.loads(zlib.decompress(f.read(length)))
+                if name in DICT_COLUMNS:
+                    lookup = values["values"]
+                    values = [lookup[code] for code in values["codes"]]
+                columns[name] = values
+        return columns
+
+    def read_rows(self, day: str) -> list[dict]:
+        columns = self.read_columns(day, ACCESS_LOG_COLUMNS)
+        return [dict(zip(ACCESS_LOG_COLUMNS, values)) for values in zip(*columns.values())]
+
+    def query(self, limit: int, blocked_only: bool = False, ip: str = "") -> list[dict]:
+        """按时间倒序返回归档日志，跳过不可能包含结果的段"""
+        results: list[dict] = []
+        for header in self.segments():
+            if len(results) >= limit:
+                break
+            if blocked_only and not header["blocked"]:
+                continue
+            if ip and not header["min_ip"] <= ip <= header["max_ip"]:
+                continue
+            columns = self.read_columns(header["day"], ("ip", "blocked"))
+            matched = [
+                i for i in range(header["rows"] - 1, -1, -1)
+                if (not blocked_only or columns["blocked"][i])
+                and (not ip or columns["ip"][i] == ip)
+            ][: limit - len(results)]
+            if not matched:
+                continue
+            rows = self.read_columns(header["day"], ACCESS_LOG_COLUMNS)
+            results += [{name: rows[name][i] for name in ACCESS_LOG_COLUMNS} for i in matched]
+        return results
+
+    def totals(self) -> dict:
+        """全部归档的请求数和拦截数，只读取段头部"""
+        headers = self.segments()
+        return {
+            "segments": len(headers),
+            "rows": sum(header["rows"] for header in headers),
+            "blocked": sum(header["blocked"] for header in headers),
+        }
+
+    def ip_counts(self, since: str) -> StackCounter:
+        """统计 since 之后各IP的请求数"""
+        counts: StackCounter = StackCounter()
+        for header in self.segments():
+            if header["max_time"] <= since:
+                break
+            columns = self.read_columns(header["day"], ("ip", "created_at"))
+            counts.update(
+                ip for ip, created_at in zip(columns["ip"], columns["created_at"])
+                if created_at > since
+            )
+        return counts
+
+
+access_log_archive = AccessLogArchive(ACCESS_LOG_ARCHIVE_DIR)
+
+
+def iter_access_log_day(conn: sqlite3.Connection, day: str, next_day: str) -> Iterator[dict]:
+    """按 (created_at, id) 顺序分批读取一天的访问日志，每批是独立的读操作"""
+    last = ("", 0)
+    while True:
+        rows = conn.execute(
+            f"""
+            SELECT {", ".join(ACCESS_LOG_COLUMNS)}
+            FROM access_logs
+            WHERE created_at >= ? AND created_at < ? AND (created_at, id) > (?, ?)
+            ORDER BY created_at, id
+            LIMIT ?
+            """,
+            (day, next_day, *last, ACCESS_LOG_ROTATE_BATCH),
+        ).fetchall()
+        for row in rows:
+            record = {name: row[name] for name in ACCESS_LOG_COLUMNS}
+            record["blocked"] = int(record["blocked"] or 0)
+            yield record
+        if len(rows) < ACCESS_LOG_ROTATE_BATCH:
+            return
+        last = (rows[-1]["created_at"], rows[-1]["id"])
+
+
+def dedupe_by_id(rows: Iterable[dict]) -> Iterator[dict]:
+    """合并后的有序记录中，相同id的记录相邻，只保留第一条"""
+    last_id = None
+    for row in rows:
+        if row["id"] != last_id:
+            yield row
+            last_id = row["id"]
+
+
+def rotate_access_logs() -> list[dict]:
+    """把保留期之前的完整日期从数据库移到段文件，返回新写入段的头部
+
+    读取和删除都按批进行并在批之间提交，避免长时间持有数据库锁阻塞访问日志和登录等写入。
+    """
+    cutoff = (datetime.utcnow().date() - timedelta(days=ACCESS_LOG_HOT_DAYS)).isoformat()
+    written = []
+    # 在线程中执行，使用普通连接：TimedConnection 会更新指标和追踪，只能在事件循环线程中使用
+    conn = sqlite3.connect(DB_PATH, timeout=5)
+    conn.row_factory = sqlite3.Row
+    with closing(conn):
+        while True:
+            # 每次取最早的一天，走 created_at 索引，不扫描全部历史记录
+            oldest = conn.execute("SELECT MIN(created_at) AS oldest FROM access_logs").fetchone()["oldest"]
+            if oldest is None or oldest >= cutoff:
+                break
+            day = oldest[:10]
+            next_day = (datetime.fromisoformat(day) + timedelta(days=1)).date().isoformat()
+            rows = iter_access_log_day(conn, day, next_day)
+            # 上次归档写完段文件但没删完数据库记录时，合并已有的段并按id去重
+            if access_log_archive.exists(day):
+                rows = dedupe_by_id(heapq.merge(
+                    access_log_archive.read_rows(day),
+                    rows,
+                    key=lambda row: (row["created_at"], row["id"]),
+                ))
+            header = access_log_archive.write(day, rows)
+            if header is None:
+                break
+            written.append(header)
+            while True:
+                deleted = conn.execute(
+                    """
+                    DELETE FROM access_logs WHERE id IN (
+                        SELECT id FROM access_logs
+                        WHERE created_at >= ? AND created_at < ? AND id <= ?
+                        LIMIT ?
+                    )
+                    """,
+                    (day, next_day, header["max_id"], ACCESS_LOG_ROTATE_BATCH),
+                ).rowcount
+                conn.commit()
+                if deleted < ACCESS_LOG_ROTATE_BATCH:
+                    break
+                # 让出写锁，等待中的请求可以在批次之间写入
+                time.sleep(0.01)
+    return written
+
+
+class AccessLogRotator:
+    """后台定时归档访问日志，同机多worker通过租约只选出一个执行"""
+
+    def __init__(self):
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}"
+        self.last_run: dict = {}
+        self._running = False
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self) -> None:
+        await asyncio.sleep(random.uniform(5, 60))
+        while True:
+            try:
+                if upstream_cache.acquire_lease(
+                    "access_log_rotate", self.owner, ACCESS_LOG_ROTATE_INTERVAL * 2
+                ):
+                    await self.run_once()
+            except Exception:
+                logger.exception("访问日志归档失败")
+            await asyncio.sleep(ACCESS_LOG_ROTATE_INTERVAL)
+
+    async def run_once(self) -> dict | None:
+        """执行一轮归档；本进程或同机其他worker正在归档时返回 None"""
+        if self._running:
+            return None
+        # 定时任务和手动触发可能落在不同worker上，用短租约保证同一时间只有一个在写段文件
+        if not upstream_cache.acquire_lease("access_log_rotate_run", self.owner, 600):
+            return None
+        self._running = True
+        start = time.time()
+        try:
+            # 压缩和写文件放到线程中执行，不阻塞事件循环
+            written = await asyncio.to_thread(rotate_access_logs)
+        finally:
+            self._running = False
+            upstream_cache.release_lease("access_log_rotate_run", self.owner)
+        self.last_run = {
+            "started_at": datetime.utcfromtimestamp(start).isoformat(),
+            "duration": round(time.time() - start, 3),
+            "segments": [header["day"] for header in written],
+            "rows": sum(header["rows"] for header in written),
+        }
+        return self.last_run
+
+
+access_log_rotator = AccessLogRotator()
+
+
 # ==================== 管理接口 ====================
 
 @app.get("/admin/access-logs")
 async def get_access_logs(
     request: Request, 
     limit: int = 100,
-    blocked_only: bool = False
+    blocked_only: bool = False,
+    ip: str = ""
 ):
-    """获取访问日志（需要认证）"""
+    """获取访问日志（需要认证），数据库中的记录不够时继续查询归档"""
     username = get_username_from_token(request)
     if not username:
         return JSONResponse({"code": 401, "message": "未登录"}, status_code=401)
@@ -766,15 +2850,24 @@ async def get_access_logs(
             SELECT ip, path, method, user_agent, status_code, created_at, blocked
             FROM access_logs
         """
+        conditions = []
         params = []
         
         if blocked_only:
-            query += " WHERE blocked = 1"
+            conditions.append("blocked = 1")
+        if ip:
+            conditions.append("ip = ?")
+            params.append(ip)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
         
         query += " ORDER BY created_at DESC LIMIT ?"
         params.append(limit)
         
-        rows = conn.execute(query, params).fetchall()
+        rows = [dict(row) for row in conn.execute(query, params).fetchall()]
+    
+    if len(rows) < limit:
+        rows += access_log_archive.query(limit - len(rows), blocked_only, ip)
     
     data = [
         {
@@ -791,6 +2884,41 @@ async def get_access_logs(
     return JSONResponse({"code": 200, "data": {"list": data}})
 
 
+@app.get("/admin/access-logs/segments")
+async def get_access_log_segments(request: Request):
+    """查看访问日志归档段（需要认证）"""
+    username = get_username_from_token(request)
+    if not username:
+        return JSONResponse({"code": 401, "message": "未登录"}, status_code=401)
+
+    segments = [
+        {key: value for key, value in header.items() if key not in {"columns", "data_offset"}}
+        for header in access_log_archive.segments()
+    ]
+    return JSONResponse({
+        "code": 200,
+        "data": {
+            "directory": access_log_archive.directory,
+            "hot_days": ACCESS_LOG_HOT_DAYS,
+            "last_run": access_log_rotator.last_run,
+            "list": segments,
+        },
+    })
+
+
+@app.post("/admin/access-logs/rotate")
+async def rotate_access_log_segments(request: Request):
+    """立即归档保留期之前的访问日志（需要认证）"""
+    username = get_username_from_token(request)
+    if not username:
+        return JSONResponse({"code": 401, "message": "未登录"}, status_code=401)
+
+    result = await access_log_rotator.run_once()
+    if result is None:
+        return JSONResponse({"code": 409, "message": "归档正在进行中"}, status_code=409)
+    return JSONResponse({"code": 200, "message": "归档完成", "data": result})
+
+
 @app.post("/admin/blacklist")
 async def add_to_blacklist(request: Request):
     """添加IP到黑名单（需要认证）"""
@@ -900,17 +3028,24 @@ async def get_admin_stats(request: Request):
         blacklist_count = conn.execute("SELECT COUNT(*) as count FROM ip_blacklist").fetchone()["count"]
         
         # 访问最多的IP（最近24小时）
-        top_ips = conn.execute(
+        ip_counts = conn.execute(
             """
             SELECT ip, COUNT(*) as count
             FROM access_logs
             WHERE datetime(created_at) > datetime('now', '-24 hours')
             GROUP BY ip
-            ORDER BY count DESC
-            LIMIT 10
             """
         ).fetchall()
     
+    # 合并归档中的历史数据
+    archived = access_log_archive.totals()
+    total_requests += archived["rows"]
+    blocked_requests += archived["blocked"]
+    since = (datetime.utcnow() - timedelta(hours=24)).isoformat()
+    counts = access_log_archive.ip_counts(since)
+    counts.update({row["ip"]: row["count"] for row in ip_counts})
+    top_ips = counts.most_common(10)
+    
     return JSONResponse({
         "code": 200,
         "data": {
@@ -919,8 +3054,153 @@ async def get_admin_stats(request: Request):
             "today_requests": today_requests,
             "blacklist_count": blacklist_count,
             "block_rate": f"{(blocked_requests/total_requests*100):.2f}%" if total_requests > 0 else "0%",
-            "top_ips": [{"ip": row["ip"], "count": row["count"]} for row in top_ips],
+            "top_ips": [{"ip": ip, "count": count} for ip, count in top_ips],
             "active_rate_limits": len(rate_limit_store),
             "locked_ips": len([ip for ip, data in login_attempts.items() if data.get("locked_until")])
         }
     })
+
+
+@app.get("/admin/ua-rules")
+async def get_ua_rules(request: Request):
+    """获取当前User-Agent规则（需要认证）"""
+    username = get_username_from_token(request)
+    if not username:
+        return JSONResponse({"code": 401, "message": "未登录"}, status_code=401)
+
+    return JSONResponse({"code": 200, "data": ua_rules.to_dict()})
+
+
+@app.post("/admin/ua-rules/reload")
+async def reload_ua_rules(request: Request):
+    """热加载User-Agent规则（需要认证）
+
+    请求体为规则JSON时直接替换，为空时从规则文件重新加载。
+    """
+    global ua_rules
+    username = get_username_from_token(request)
+    if not username:
+        return JSONResponse({"code": 401, "message": "未登录"}, status_code=401)
+
+    body = await request.body()
+    try:
+        new_rules = UARuleSet.from_dict(json.loads(body)) if body else load_ua_rules()
+    except (ValueError, OSError) as exc:
+        return JSONResponse({"code": 400, "message": f"规则无效：{exc}"}, status_code=400)
+
+    # 整体替换规则集，判定缓存随旧规则集一起失效
+    ua_rules = new_rules
+    return JSONResponse({
+        "code": 200,
+        "message": "规则已更新",
+        "data": {
+            "deny": len(ua_rules.deny),
+            "allow": len(ua_rules.allow),
+            "paths": len(ua_rules.paths),
+        },
+    })
+
+
+@app.get("/admin/traces/slow")
+async def get_slow_traces(request: Request, limit: int = 20):
+    """获取最慢的追踪请求及各阶段耗时（需要认证）"""
+    username = get_username_from_token(request)
+    if not username:
+        return JSONResponse({"code": 401, "message": "未登录"}, status_code=401)
+
+    records = [record for _, _, record in heapq.nlargest(limit, slow_traces)]
+    return JSONResponse({
+        "code": 200,
+        "data": {"list": records, "sample_rate": TRACE_SAMPLE_RATE, "capacity": SLOW_TRACE_LIMIT},
+    })
+
+
+@app.delete("/admin/traces/slow")
+async def clear_slow_traces(request: Request):
+    """清空最慢请求记录（需要认证）"""
+    username = get_username_from_token(request)
+    if not username:
+        return JSONResponse({"code": 401, "message": "未登录"}, status_code=401)
+
+    slow_traces.clear()
+    return JSONResponse({"code": 200, "message": "已清空"})
+
+
+@app.post("/admin/profile")
+async def capture_profile(request: Request, seconds: float = 5.0, top: int = 50):
+    """对事件循环线程做一次采样分析（需要认证）
+
+    返回折叠格式的调用栈计数，可直接用于生成火焰图。
+    """
+    username = get_username_from_token(request)
+    if not username:
+        return JSONResponse({"code": 401, "message": "未登录"}, status_code=401)
+
+    seconds = max(0.1, min(seconds, PROFILE_MAX_SECONDS))
+    # 采样在线程中进行，事件循环照常处理请求
+    stacks = await asyncio.to_thread(
+        sample_stacks, threading.get_ident(), seconds, PROFILE_INTERVAL
+    )
+    total = sum(stacks.values())
+    return JSONResponse({
+        "code": 200,
+        "data": {
+            "seconds": seconds,
+            "samples": total,
+            "stacks": [
+                {"stack": stack, "count": count} for stack, count in stacks.most_common(top)
+            ],
+        },
+    })
+
+
+@app.get("/admin/cache")
+async def get_cache_stats(request: Request):
+    """获取上游缓存状态（需要认证）"""
+    username = get_username_from_token(request)
+    if not username:
+        return JSONResponse({"code": 401, "message": "未登录"}, status_code=401)
+
+    return JSONResponse({"code": 200, "data": upstream_cache.stats()})
+
+
+@app.delete("/admin/cache")
+async def clear_cache(request: Request):
+    """清空上游缓存（需要认证）"""
+    username = get_username_from_token(request)
+    if not username:
+        return JSONResponse({"code": 401, "message": "未登录"}, status_code=401)
+
+    upstream_cache.clear()
+    return JSONResponse({"code": 200, "message": "缓存已清空"})
+
+
+@app.get("/admin/prewarm")
+async def get_prewarm_status(request: Request):
+    """获取榜单预热状态（需要认证）"""
+    username = get_username_from_token(request)
+    if not username:
+        return JSONResponse({"code": 401, "message": "未登录"}, status_code=401)
+
+    return JSONResponse({
+        "code": 200,
+        "data": {
+            "enabled": PREWARM_ENABLED,
+            "interval": PREWARM_INTERVAL,
+            "owner": prewarm_scheduler.owner,
+            "last_run": prewarm_scheduler.last_run,
+        },
+    })
+
+
+@app.post("/admin/prewarm")
+async def trigger_prewarm(request: Request):
+    """立即执行一轮榜单预热（需要认证）"""
+    username = get_username_from_token(request)
+    if not username:
+        return JSONResponse({"code": 401, "message": "未登录"}, status_code=401)
+
+    result = await prewarm_scheduler.run_once()
+    if result is None:
+        return JSONResponse({"code": 409, "message": "预热正在进行中"}, status_code=409)
+    return JSONResponse({"code": 200, "message": "预热完成", "data": result})
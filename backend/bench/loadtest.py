@@ -0,0 +1,371 @@
+"""HeartBeat 后端压测
+
+启动本地上游模拟服务和后端应用（独立的临时数据库），按场景发起混合请求，
+输出各操作的吞吐量和 p50/p95/p99 延迟。结果可写入 JSON，并与另一次结果对比。
+
+在 backend 目录下运行：
+    python -m bench.loadtest --scenario mixed --duration 30 --concurrency 32
+    python -m bench.loadtest --output after.json --compare before.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BROWSER_UA = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/126.0 Safari/537.36"
+)
+SOURCES = ("netease", "kuwo", "qq")
+KEYWORDS = ("周杰伦", "陈奕迅", "林俊杰", "孙燕姿", "五月天", "邓紫棋", "薛之谦", "王菲")
+
+# 各场景中操作的权重
+SCENARIOS = {
+    "mixed": {
+        "search": 20,
+        "charts": 10,
+        "playback": 35,
+        "favorites": 20,
+        "bootstrap": 10,
+        "login": 5,
+    },
+    "search": {"search": 1},
+    "charts": {"charts": 1},
+    "playback": {"playback": 1},
+    "favorites": {"favorites": 1},
+    "login": {"login": 1},
+}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BACKEND_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def start_server(module: str, port: int, env: dict, workers: int = 1) -> subprocess.Popen:
+    cmd = [
+        sys.executable, "-m", "uvicorn", module,
+        "--host", "127.0.0.1", "--port", str(port),
+        "--log-level", "warning", "--no-access-log",
+    ]
+    if workers > 1:
+        cmd += ["--workers", str(workers)]
+    return subprocess.Popen(cmd, cwd=BACKEND_DIR, env={**os.environ, **env})
+
+
+async def wait_ready(url: str, timeout: float = 15.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(headers={"user-agent": BROWSER_UA}) as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(url)).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"服务未就绪：{url}")
+
+
+class Recorder:
+    """按操作名记录请求延迟与失败数"""
+
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+
+    async def timed(self, name: str, coro) -> httpx.Response | None:
+        start = time.perf_counter()
+        try:
+            response = await coro
+        except httpx.HTTPError:
+            self.errors[name] += 1
+            return None
+        self.latencies[name].append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            self.errors[name] += 1
+        return response
+
+
+class VirtualUser:
+    """模拟一个前端用户的请求序列"""
+
+    def __init__(self, client: httpx.AsyncClient, recorder: Recorder, username: str, password: str):
+        self.client = client
+        self.recorder = recorder
+        self.username = username
+        self.password = password
+        self.token = ""
+        self.tracks: list[dict] = []
+        self.favorites: list[dict] = []
+
+    @property
+    def auth(self) -> dict:
+        return {"authorization": f"Bearer {self.token}"}
+
+    async def login(self) -> None:
+        response = await self.recorder.timed(
+            "auth.login",
+            self.client.post(
+                "/auth/login", json={"username": self.username, "password": self.password}
+            ),
+        )
+        if response is not None and response.status_code == 200:
+            self.token = response.json()["data"]["token"]
+
+    async def search(self) -> None:
+        params = {
+            "type": "search",
+            "source": random.choice(SOURCES),
+            "keyword": random.choice(KEYWORDS),
+            "limit": "50",
+        }
+        response = await self.recorder.timed("api.search", self.client.get("/api/", params=params))
+        if response is not None and response.status_code == 200:
+            results = response.json().get("data", {}).get("results", [])
+            for item in results[:10]:
+                self.tracks.append({"id": item["id"], "source": item.get("platform", params["source"]),
+                                    "name": item["name"], "artist": item.get("artist", "")})
+            del self.tracks[:-50]
+
+    async def charts(self) -> None:
+        source = random.choice(SOURCES)
+        response = await self.recorder.timed(
+            "api.toplists", self.client.get("/api/", params={"type": "toplists", "source": source})
+        )
+        if response is None or response.status_code != 200:
+            return
+        charts = response.json().get("data", {}).get("list", [])
+        if not charts:
+            return
+        chart = random.choice(charts[:5])
+        await self.recorder.timed(
+            "api.toplist",
+            self.client.get("/api/", params={"type": "toplist", "source": source, "id": chart["id"]}),
+        )
+
+    async def playback(self) -> None:
+        if not self.tracks:
+            await self.search()
+            if not self.tracks:
+                return
+        track = random.choice(self.tracks)
+        base = {"source": track["source"], "id": track["id"]}
+        await asyncio.gather(
+            self.recorder.timed("api.url", self.client.get("/api/", params={**base, "type": "url", "br": "320k"})),
+            self.recorder.timed("api.pic", self.client.get("/api/", params={**base, "type": "pic"})),
+            self.recorder.timed("api.lrc", self.client.get("/api/", params={**base, "type": "lrc"})),
+        )
+
+    async def favorites_churn(self) -> None:
+        if not self.token:
+            await self.login()
+        if self.tracks and (not self.favorites or random.random() < 0.6):
+            track = random.choice(self.tracks)
+            await self.recorder.timed(
+                "favorites.add", self.client.post("/favorites", json=track, headers=self.auth)
+            )
+            self.favorites.append(track)
+        elif self.favorites:
+            track = self.favorites.pop(random.randrange(len(self.favorites)))
+            await self.recorder.timed(
+                "favorites.remove",
+                self.client.delete(
+                    "/favorites", params={"id": track["id"], "source": track["source"]}, headers=self.auth
+                ),
+            )
+        await self.recorder.timed("favorites.list", self.client.get("/favorites", headers=self.auth))
+
+    async def bootstrap(self) -> None:
+        """模拟页面加载时的用户数据拉取"""
+        if not self.token:
+            await self.login()
+        await self.recorder.timed("me.bootstrap", self.client.get("/me/bootstrap", headers=self.auth))
+
+    async def run(self, weights: dict[str, int], deadline: float) -> None:
+        actions = {
+            "search": self.search,
+            "charts": self.charts,
+            "playback": self.playback,
+            "favorites": self.favorites_churn,
+            "bootstrap": self.bootstrap,
+            "login": self.login,
+        }
+        names = list(weights)
+        counts = [weights[name] for name in names]
+        while time.monotonic() < deadline:
+            await actions[random.choices(names, counts)[0]]()
+
+
+async def setup_users(client: httpx.AsyncClient, count: int) -> list[tuple[str, str]]:
+    users = []
+    for i in range(count):
+        username, password = f"bench{i}", f"bench-password-{i}"
+        await client.post("/auth/register", json={"username": username, "password": password})
+        users.append((username, password))
+    return users
+
+
+def summarize(recorder: Recorder, elapsed: float) -> dict:
+    operations = {}
+    all_latencies: list[float] = []
+    for name in sorted(set(recorder.latencies) | set(recorder.errors)):
+        values = sorted(recorder.latencies.get(name, []))
+        all_latencies.extend(values)
+        operations[name] = {
+            "count": len(values),
+            "errors": recorder.errors.get(name, 0),
+            "rps": len(values) / elapsed if elapsed else 0.0,
+            "p50_ms": percentile(values, 50) * 1000,
+            "p95_ms": percentile(values, 95) * 1000,
+            "p99_ms": percentile(values, 99) * 1000,
+        }
+    all_latencies.sort()
+    total = {
+        "count": len(all_latencies),
+        "errors": sum(recorder.errors.values()),
+        "rps": len(all_latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(all_latencies, 50) * 1000,
+        "p95_ms": percentile(all_latencies, 95) * 1000,
+        "p99_ms": percentile(all_latencies, 99) * 1000,
+    }
+    return {"operations": operations, "total": total}
+
+
+def print_report(result: dict, baseline: dict | None = None) -> None:
+    header = f"{'operation':<18}{'count':>8}{'errors':>8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    if baseline:
+        header += f"{'Δrps':>9}{'Δp95':>9}"
+    print(f"commit={result['commit']} scenario={result['config']['scenario']} "
+          f"duration={result['elapsed']:.1f}s concurrency={result['config']['concurrency']}")
+    print(header)
+    rows = list(result["operations"].items()) + [("TOTAL", result["total"])]
+    for name, stats in rows:
+        line = (f"{name:<18}{stats['count']:>8}{stats['errors']:>8}{stats['rps']:>10.1f}"
+                f"{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}")
+        if baseline:
+            before = baseline["total"] if name == "TOTAL" else baseline["operations"].get(name)
+            if before and before["rps"] and before["p95_ms"]:
+                line += (f"{(stats['rps'] / before['rps'] - 1) * 100:>8.1f}%"
+                         f"{(stats['p95_ms'] / before['p95_ms'] - 1) * 100:>8.1f}%")
+        print(line)
+
+
+async def run_benchmark(args: argparse.Namespace) -> dict:
+    random.seed(args.seed)
+    stub_port, app_port = free_port(), free_port()
+    workdir = tempfile.mkdtemp(prefix="heartbeat-bench-")
+    stub_env = {
+        "BENCH_STUB_LATENCY_MS": str(args.latency_ms),
+        "BENCH_STUB_JITTER_MS": str(args.jitter_ms),
+        "BENCH_STUB_ITEMS": str(args.items),
+        "BENCH_STUB_LRC_LINES": str(args.lrc_lines),
+        "BENCH_STUB_REDIRECTS": str(args.redirects),
+    }
+    app_env = {
+        "TUNEHUB_BASE_URL": f"http://127.0.0.1:{stub_port}",
+        "TUNEHUB_DB_PATH": os.path.join(workdir, "bench.sqlite"),
+        # 压测流量全部来自本机，放开频率限制
+        "RATE_LIMIT_REQUESTS": str(10**9),
+        # 后台预热会干扰测量
+        "PREWARM_ENABLED": "0",
+    }
+    servers = [
+        start_server("bench.upstream_stub:app", stub_port, stub_env),
+        start_server("app.main:app", app_port, app_env, workers=args.workers),
+    ]
+    try:
+        await wait_ready(f"http://127.0.0.1:{stub_port}/health")
+        await wait_ready(f"http://127.0.0.1:{app_port}/health")
+        limits = httpx.Limits(max_connections=args.concurrency * 4)
+        async with httpx.AsyncClient(
+            base_url=f"http://127.0.0.1:{app_port}",
+            headers={"user-agent": BROWSER_UA},
+            limits=limits,
+            timeout=30,
+        ) as client:
+            users = await setup_users(client, args.users)
+            recorder = Recorder()
+            weights = SCENARIOS[args.scenario]
+            start = time.monotonic()
+            deadline = start + args.duration
+            await asyncio.gather(*[
+                VirtualUser(client, recorder, *users[i % len(users)]).run(weights, deadline)
+                for i in range(args.concurrency)
+            ])
+            elapsed = time.monotonic() - start
+    finally:
+        for server in servers:
+            server.terminate()
+        for server in servers:
+            server.wait(timeout=10)
+
+    return {
+        "commit": git_commit(),
+        "config": {key: value for key, value in vars(args).items() if key not in {"output", "compare"}},
+        "elapsed": elapsed,
+        **summarize(recorder, elapsed),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="HeartBeat 后端压测")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="mixed")
+    parser.add_argument("--duration", type=float, default=20.0, help="压测时长（秒）")
+    parser.add_argument("--concurrency", type=int, default=32, help="并发虚拟用户数")
+    parser.add_argument("--users", type=int, default=16, help="注册的账号数")
+    parser.add_argument("--workers", type=int, default=1, help="后端 uvicorn worker 数")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="上游固定延迟")
+    parser.add_argument("--jitter-ms", type=float, default=20.0, help="上游随机延迟上限")
+    parser.add_argument("--items", type=int, default=30, help="上游列表接口返回条目数")
+    parser.add_argument("--lrc-lines", type=int, default=60, help="上游歌词行数")
+    parser.add_argument("--redirects", type=int, default=0, help="上游 JSON 接口跳转次数")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="结果 JSON 输出路径")
+    parser.add_argument("--compare", help="用于对比的历史结果 JSON")
+    args = parser.parse_args()
+
+    result = asyncio.run(run_benchmark(args))
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(result, baseline)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""HeartBeat 后端热点函数微基准
+
+直接调用 app.main 中的函数（使用临时数据库），按批次计时，
+输出每次调用的平均耗时和 p50/p95/p99。
+
+在 backend 目录下运行：
+    python -m bench.microbench
+    python -m bench.microbench --filter ua --output micro.json
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 必须在导入 app.main 之前设置，避免写入真实数据库
+os.environ["TUNEHUB_DB_PATH"] = os.path.join(
+    tempfile.mkdtemp(prefix="heartbeat-micro-"), "micro.sqlite"
+)
+sys.path.insert(0, BACKEND_DIR)
+
+from starlette.requests import Request  # noqa: E402
+
+from app import main as hb  # noqa: E402
+
+BROWSER_UAS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 14_5) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.5 Safari/605.1.15",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 17_5 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Mobile/15E148",
+    "Mozilla/5.0 (X11; Linux x86_64; rv:127.0) Gecko/20100101 Firefox/127.0",
+]
+
+
+def bench(func, batches: int, batch_size: int) -> dict:
+    """按批次计时，返回每次调用的耗时统计（微秒）"""
+    for _ in range(batch_size):
+        func()
+    per_call = []
+    for _ in range(batches):
+        start = time.perf_counter_ns()
+        for _ in range(batch_size):
+            func()
+        per_call.append((time.perf_counter_ns() - start) / batch_size / 1000)
+    per_call.sort()
+
+    def pct(p: float) -> float:
+        return per_call[min(len(per_call) - 1, int(p / 100 * len(per_call)))]
+
+    mean = sum(per_call) / len(per_call)
+    return {
+        "mean_us": mean,
+        "ops_per_sec": 1_000_000 / mean if mean else 0.0,
+        "p50_us": pct(50),
+        "p95_us": pct(95),
+        "p99_us": pct(99),
+    }
+
+
+def make_request(headers: dict[str, str]) -> Request:
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": "/",
+        "headers": [(k.lower().encode(), v.encode()) for k, v in headers.items()],
+    })
+
+
+def build_cases() -> dict:
+    hb.init_db()
+    hb.init_rate_limit_table()
+    hb.password_hasher.n = hb.calibrate_scrypt_n(hb.PASSWORD_HASH_TARGET_MS)
+
+    with hb.get_conn() as conn:
+        conn.execute(
+            "INSERT OR IGNORE INTO users (username, password_hash, salt, created_at) VALUES (?, ?, ?, ?)",
+            ("micro", "x", "y", "2024-01-01T00:00:00"),
+        )
+        conn.execute(
+            "INSERT OR IGNORE INTO sessions (token, username, created_at) VALUES (?, ?, ?)",
+            ("micro-token", "micro", "2024-01-01T00:00:00"),
+        )
+        conn.commit()
+    auth_request = make_request({"authorization": "Bearer micro-token"})
+
+    counter = {"n": 0}
+
+    def rate_limit_many_ips():
+        counter["n"] += 1
+        hb.check_rate_limit(f"10.0.{counter['n'] % 256}.{counter['n'] // 256 % 256}")
+
+    def rate_limit_single_ip():
+        hb.rate_limit_store["10.9.9.9"].clear()
+        for _ in range(30):
+            hb.check_rate_limit("10.9.9.9")
+
+    def ua_varied():
+        counter["n"] += 1
+        hb.check_user_agent(f"{BROWSER_UAS[counter['n'] % 4]} build/{counter['n']}", "/api/")
+
+    return {
+        "ua.cached": lambda: hb.check_user_agent(BROWSER_UAS[0], "/api/"),
+        "ua.uncached": ua_varied,
+        "route_policy.lookup": lambda: hb.route_policies.lookup("GET", "/api/"),
+        "rate_limit.many_ips": rate_limit_many_ips,
+        "rate_limit.single_ip_x30": rate_limit_single_ip,
+        "password.legacy_sha256": lambda: hb.legacy_hash_password("correct horse battery staple", "0123456789abcdef"),
+        "kdf.scrypt": lambda: hb.scrypt_hash(
+            "correct horse battery staple", "0123456789abcdef", hb.password_hasher.n
+        ),
+        "db.blacklist_lookup": lambda: hb.is_ip_blacklisted("10.1.2.3"),
+        "db.session_lookup": lambda: hb.get_username_from_token(auth_request),
+        "db.access_log_insert": lambda: hb.log_access(
+            "10.1.2.3", "/api/", "GET", BROWSER_UAS[0], 200
+        ),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="HeartBeat 后端微基准")
+    parser.add_argument("--batches", type=int, default=200, help="计时批次数")
+    parser.add_argument("--batch-size", type=int, default=50, help="每批调用次数")
+    parser.add_argument("--filter", default="", help="只运行名称包含该字符串的用例")
+    parser.add_argument("--output", help="结果 JSON 输出路径")
+    args = parser.parse_args()
+
+    results = {}
+    print(f"{'case':<28}{'mean us':>10}{'ops/s':>12}{'p50 us':>10}{'p95 us':>10}{'p99 us':>10}")
+    for name, func in build_cases().items():
+        if args.filter and args.filter not in name:
+            continue
+        # 数据库和KDF用例单次开销较大，缩小批次
+        batches, batch_size = args.batches, args.batch_size
+        if name.startswith("db."):
+            batch_size = max(1, batch_size // 10)
+        elif name.startswith("kdf."):
+            batches, batch_size = min(batches, 20), 1
+        stats = bench(func, batches, batch_size)
+        results[name] = stats
+        print(f"{name:<28}{stats['mean_us']:>10.2f}{stats['ops_per_sec']:>12.0f}"
+              f"{stats['p50_us']:>10.2f}{stats['p95_us']:>10.2f}{stats['p99_us']:>10.2f}")
+
+    if args.output:
+        try:
+            commit = subprocess.run(
+                ["git", "rev-parse", "--short", "HEAD"],
+                cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = "unknown"
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"commit": commit, "results": results}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""本地 TuneHub 上游模拟服务，供压测使用
+
+通过环境变量配置（也可用命令行参数启动）：
+    BENCH_STUB_LATENCY_MS   每个请求的固定延迟（毫秒）
+    BENCH_STUB_JITTER_MS    额外的随机延迟上限（毫秒）
+    BENCH_STUB_ITEMS        搜索/榜单/歌单返回的条目数
+    BENCH_STUB_LRC_LINES    歌词行数
+    BENCH_STUB_REDIRECTS    JSON 接口在返回内容前的 302 跳转次数
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import zlib
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, RedirectResponse, Response
+
+LATENCY_MS = float(os.getenv("BENCH_STUB_LATENCY_MS", "50"))
+JITTER_MS = float(os.getenv("BENCH_STUB_JITTER_MS", "20"))
+ITEMS = int(os.getenv("BENCH_STUB_ITEMS", "30"))
+LRC_LINES = int(os.getenv("BENCH_STUB_LRC_LINES", "60"))
+REDIRECTS = int(os.getenv("BENCH_STUB_REDIRECTS", "0"))
+
+SOURCES = ("netease", "kuwo", "qq")
+
+app = FastAPI(title="TuneHub Stub")
+
+
+async def simulate_latency() -> None:
+    delay = LATENCY_MS + random.uniform(0, JITTER_MS)
+    if delay > 0:
+        await asyncio.sleep(delay / 1000)
+
+
+def make_track(source: str, index: int, seed: str = "") -> dict:
+    track_id = str(zlib.crc32(f"{source}:{seed}:{index}".encode("utf-8")) % 10**9)
+    return {
+        "id": track_id,
+        "name": f"歌曲{seed}{index}",
+        "artist": f"歌手{index % 17}",
+        "album": f"专辑{index % 7}",
+        "platform": source,
+        "types": ["flac", "320k", "128k"],
+    }
+
+
+@app.get("/api/")
+async def api(request: Request):
+    await simulate_latency()
+    query = request.query_params
+    request_type = query.get("type", "")
+    source = query.get("source", "netease")
+    track_id = query.get("id", "0")
+
+    # 模拟上游的跳转链
+    hop = int(query.get("_hop", "0"))
+    if request_type not in {"url", "pic"} and hop < REDIRECTS:
+        params = [(k, v) for k, v in query.multi_items() if k != "_hop"]
+        params.append(("_hop", str(hop + 1)))
+        target = request.url.include_query_params(**dict(params))
+        return RedirectResponse(url=str(target), status_code=302)
+
+    if request_type == "url":
+        headers = {"x-source-switch": f"{source} -> kuwo"} if track_id.endswith("7") else {}
+        return RedirectResponse(
+            url=f"{request.base_url}media/{source}/{track_id}.mp3", status_code=302, headers=headers
+        )
+    if request_type == "pic":
+        return RedirectResponse(url=f"{request.base_url}media/{source}/{track_id}.jpg", status_code=302)
+    if request_type == "lrc":
+        lines = [
+            f"[{i // 60:02d}:{i % 60:02d}.00]第{i + 1}行歌词 {track_id}" for i in range(LRC_LINES)
+        ]
+        return PlainTextResponse("\n".join(lines))
+    if request_type == "info":
+        return JSONResponse({"code": 200, "message": "success", "data": make_track(source, 0, track_id)})
+    if request_type in {"search", "aggregateSearch"}:
+        keyword = query.get("keyword", "")
+        limit = min(int(query.get("limit", ITEMS) or ITEMS), ITEMS)
+        sources = SOURCES if request_type == "aggregateSearch" else (source,)
+        results = [make_track(src, i, keyword) for src in sources for i in range(limit)]
+        return JSONResponse({
+            "code": 200,
+            "message": "success",
+            "data": {"keyword": keyword, "total": len(results), "results": results},
+        })
+    if request_type == "toplists":
+        charts = [
+            {"id": f"{source}-{i}", "name": f"榜单{i}", "updateFrequency": "每天更新"}
+            for i in range(12)
+        ]
+        return JSONResponse({"code": 200, "data": {"list": charts}})
+    if request_type == "toplist":
+        tracks = [make_track(source, i, track_id) for i in range(ITEMS)]
+        return JSONResponse({"code": 200, "data": {"list": tracks, "source": source}})
+    if request_type == "playlist":
+        tracks = [make_track(source, i, track_id) for i in range(ITEMS)]
+        return JSONResponse({
+            "code": 200,
+            "data": {"list": tracks, "info": {"name": f"歌单{track_id}", "author": "stub"}},
+        })
+    return JSONResponse({"code": 400, "message": "unsupported type"}, status_code=400)
+
+
+@app.get("/media/{source}/{name}")
+async def media(source: str, name: str):
+    return Response(content=b"\0" * 1024, media_type="application/octet-stream")
+
+
+@app.get("/stats{suffix:path}")
+async def stats(suffix: str):
+    await simulate_latency()
+    return JSONResponse({"code": 200, "data": {"period": "today", "suffix": suffix}})
+
+
+@app.get("/health")
+async def health():
+    return JSONResponse({"code": 200, "data": {"status": "healthy"}})
+
+
+def main() -> None:
+    global LATENCY_MS, JITTER_MS, ITEMS, LRC_LINES, REDIRECTS
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="TuneHub 上游模拟服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=LATENCY_MS)
+    parser.add_argument("--jitter-ms", type=float, default=JITTER_MS)
+    parser.add_argument("--items", type=int, default=ITEMS)
+    parser.add_argument("--lrc-lines", type=int, default=LRC_LINES)
+    parser.add_argument("--redirects", type=int, default=REDIRECTS)
+    args = parser.parse_args()
+
+    LATENCY_MS, JITTER_MS = args.latency_ms, args.jitter_ms
+    ITEMS, LRC_LINES, REDIRECTS = args.items, args.lrc_lines, args.redirects
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
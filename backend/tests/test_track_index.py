@@ -0,0 +1,55 @@
+"""搜索建议索引的回归测试
+
+在 backend 目录下运行：
+    python -m pytest -q tests
+"""
+
+import os
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 必须在导入 app.main 之前设置，避免写入真实数据库
+os.environ["TUNEHUB_DB_PATH"] = os.path.join(
+    tempfile.mkdtemp(prefix="heartbeat-test-"), "test.sqlite"
+)
+sys.path.insert(0, BACKEND_DIR)
+
+import pytest  # noqa: E402
+
+from app import main as hb  # noqa: E402
+
+SEARCH_TRACK = {"id": "186016", "source": "netease", "name": "晴天", "artist": "周杰伦", "album": "叶惠美"}
+CHART_TRACK = {"id": "186016", "source": "netease", "name": "晴天", "artist": "", "album": ""}
+OTHER_TRACK = {"id": "1", "source": "netease", "name": "晴天娃娃", "artist": "歌手", "album": "专辑"}
+
+
+@pytest.fixture
+def index(tmp_path):
+    hb.init_db()
+    return hb.TrackIndex(str(tmp_path / "search.sqlite"))
+
+
+def test_chart_entry_keeps_artist_and_album(index):
+    index.add_tracks([SEARCH_TRACK])
+    index.add_tracks([CHART_TRACK], count_hits=False)
+
+    row = index._get_conn().execute(
+        "SELECT artist, album FROM tracks WHERE track_id = ?", (SEARCH_TRACK["id"],)
+    ).fetchone()
+    assert (row["artist"], row["album"]) == ("周杰伦", "叶惠美")
+    assert [t["id"] for t in index.suggest("周杰伦")] == [SEARCH_TRACK["id"]]
+    if hb.lazy_pinyin is not None:
+        assert [t["id"] for t in index.suggest("zjl")] == [SEARCH_TRACK["id"]]
+
+
+def test_chart_refresh_does_not_raise_hits(index):
+    index.add_tracks([OTHER_TRACK])
+    index.add_tracks([OTHER_TRACK])
+    for _ in range(5):
+        index.add_tracks([CHART_TRACK], count_hits=False)
+
+    hits = dict(index._get_conn().execute("SELECT track_id, hits FROM tracks").fetchall())
+    assert hits == {OTHER_TRACK["id"]: 2, CHART_TRACK["id"]: 0}
+    assert [t["id"] for t in index.suggest("晴天")] == [OTHER_TRACK["id"], CHART_TRACK["id"]]
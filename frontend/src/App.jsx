@@ -17,6 +17,7 @@ export default function App() {
   const [currentUser, setCurrentUser] = useState("");
   const [searchKeyword, setSearchKeyword] = useState("");
   const [searchResults, setSearchResults] = useState([]);
+  const [searchSuggestions, setSearchSuggestions] = useState([]);
   const [searchError, setSearchError] = useState("");
   const [searchLoading, setSearchLoading] = useState(false);
   const [searchSource, setSearchSource] = useState("netease");
@@ -93,26 +94,43 @@ export default function App() {
       setCurrentUser(cachedUser);
     }
     if (!token) return;
-    fetch(`${API_BASE}/auth/me`, {
-      headers: { Authorization: `Bearer ${token}` },
-    })
-      .then((res) => res.json())
-      .then((data) => {
-        if (data?.data?.username) {
-          setCurrentUser(data.data.username);
-          localStorage.setItem("auth_user", data.data.username);
-          fetchFavorites(token);
-          fetchProfile(token);
-          fetchLogs(token);
-        } else {
-          setCurrentUser("");
-          localStorage.removeItem("auth_user");
-          localStorage.removeItem("auth_token");
-        }
-      })
-      .catch(() => {});
+    fetchBootstrap(token);
   }, []);
 
+  const fetchBootstrap = async (token) => {
+    if (!token) return;
+    try {
+      const res = await fetch(`${API_BASE}/me/bootstrap`, {
+        headers: { Authorization: `Bearer ${token}` },
+      });
+      const data = await res.json();
+      const payload = data?.data;
+      if (!payload?.user?.username) {
+        setCurrentUser("");
+        localStorage.removeItem("auth_user");
+        localStorage.removeItem("auth_token");
+        return;
+      }
+      setCurrentUser(payload.user.username);
+      localStorage.setItem("auth_user", payload.user.username);
+      setProfile({
+        nickname: payload.profile?.nickname || "",
+        signature: payload.profile?.signature || "",
+        avatar_url: payload.profile?.avatar_url || "",
+      });
+      setLogs(payload.logs || []);
+      setLogPage(1);
+      if (payload.favorites?.has_more) {
+        fetchFavorites(token);
+      } else {
+        setFavorites(payload.favorites?.list || []);
+        setFavoritePage(1);
+      }
+    } catch (error) {
+      // ignore
+    }
+  };
+
   const fetchFavorites = async (token) => {
     if (!token) return;
     setFavoritesLoading(true);
@@ -207,6 +225,38 @@ export default function App() {
     fetchSearchResults(keyword, searchSource);
   }, [searchSource]);
 
+  // 输入联想只查询后端本地索引，提交时才请求上游搜索
+  useEffect(() => {
+    const keyword = searchKeyword.trim();
+    if (!keyword) {
+      setSearchSuggestions([]);
+      return;
+    }
+    const controller = new AbortController();
+    const timer = setTimeout(async () => {
+      try {
+        const params = new URLSearchParams({
+          keyword,
+          source: searchSource,
+          limit: "8",
+        });
+        const res = await fetch(`${API_BASE}/suggest?${params.toString()}`, {
+          signal: controller.signal,
+        });
+        const data = await res.json();
+        if (res.ok && data?.code === 200) {
+          setSearchSuggestions(data?.data?.results || []);
+        }
+      } catch (error) {
+        // ignore
+      }
+    }, 150);
+    return () => {
+      clearTimeout(timer);
+      controller.abort();
+    };
+  }, [searchKeyword, searchSource]);
+
   const submitAuth = async (event) => {
     event.preventDefault();
     setStatus("");
@@ -224,9 +274,7 @@ export default function App() {
       }
       if (data?.data?.token) {
         localStorage.setItem("auth_token", data.data.token);
-        fetchFavorites(data.data.token);
-        fetchProfile(data.data.token);
-        fetchLogs(data.data.token);
+        fetchBootstrap(data.data.token);
       }
       if (data?.data?.username) {
         setCurrentUser(data.data.username);
@@ -834,7 +882,16 @@ export default function App() {
               placeholder="搜索 100,000+ 首音乐"
               value={searchKeyword}
               onChange={(event) => setSearchKeyword(event.target.value)}
+              list="search-suggestions"
             />
+            <datalist id="search-suggestions">
+              {searchSuggestions.map((item) => (
+                <option
+                  key={`${item.source}-${item.id}`}
+                  value={`${item.name} ${item.artist}`.trim()}
+                />
+              ))}
+            </datalist>
             <button type="submit" aria-label="Search">
               搜索
             </button>